@@ -1,6 +1,14 @@
+import queue
+import threading
+from functools import partial
 import gradio as gr
 from PIL import Image
-from utils.predictor import predict_image, predict_map
+import config
+from utils.predictor import predict_image, predict_images, predict_map, scheduler, ENSEMBLE
+from utils.scheduler import QueueFull
+from utils.overlay_tiles import OverlayTileServer, tile_url
+from utils.image_processing import split_by_class
+from utils.wire import display_file, class_image_file, mask_file
 import folium
 from folium.plugins import MousePosition
 from folium.raster_layers import TileLayer
@@ -16,6 +24,20 @@ def create_folium_map(lat, lon, zoom):
         control=True
     ).add_to(fmap)
 
+    if config.OVERLAY_TILES_ENABLED:
+        # Segmentation of everything captured so far, served by the local overlay tile server
+        for name in ["YOLOv11", "UNet", "MaskRCNN", ENSEMBLE]:
+            TileLayer(
+                tiles=tile_url(name),
+                attr="Segmentation",
+                name=f"{name} segmentation",
+                overlay=True,
+                control=True,
+                show=False,
+                opacity=0.5
+            ).add_to(fmap)
+        folium.LayerControl().add_to(fmap)
+
     marker = folium.Marker(location=[lat, lon], draggable=True)
     marker.add_to(fmap)
 
@@ -72,34 +94,98 @@ setTimeout(() => {{
     return fmap._repr_html_()
 
 
+def _predict(image, model_type):
+    if not config.SCHEDULER_ENABLED:
+        return predict_image(image, model_type)
+    try:
+        return scheduler.predict_image(image, model_type)
+    except QueueFull as e:
+        raise gr.Error(f"Server busy, please retry: {e}")
+
+
+def _predict_many(images, model_type):
+    if not config.SCHEDULER_ENABLED:
+        return predict_images(images, model_type)
+    # Submit everything before waiting so the scheduler can coalesce the images into batches
+    try:
+        futures = [scheduler.submit(image, model_type) for image in images]
+    except QueueFull as e:
+        raise gr.Error(f"Server busy, please retry: {e}")
+    return [future.result() for future in futures]
+
+
+def _gallery(result):
+    # Ensemble results also show each member's own overlay
+    members = [(display_file(overlay), name) for name, overlay in result.get("model_overlays", {}).items()]
+    return [display_file(result["original"]), display_file(result["overlay"]), *members]
+
+
+def _areas(result):
+    if "model_areas" not in result:
+        return result["areas"]
+    return {ENSEMBLE: result["areas"], **result["model_areas"], "agreement": result["agreement"]}
+
+
+def _timings(result):
+    return {"profile": result.get("profile"), "queue": result.get("timings")}
+
+
+def _stream_result(result):
+    """
+    Yield handler outputs for a finished result: gallery and areas first,
+    then display-sized class images one by one, then the full-resolution
+    mask download.
+    """
+    class_images = []
+    yield _gallery(result), class_images, _areas(result), _timings(result), None
+    # Per-class views are rendered from one mask reduced to display size
+    for image in split_by_class(result["mask"], max_size=config.DISPLAY_MAX_SIZE):
+        class_images.append(class_image_file(image))
+        yield gr.update(), list(class_images), gr.update(), gr.update(), gr.update()
+    yield gr.update(), gr.update(), gr.update(), gr.update(), mask_file(result["mask"])
+
+
 def predict_uploaded_image(model_type, image):
-    result = predict_image(image, model_type)
+    if image is None:
+        raise gr.Error("Please upload an image")
+    yield [display_file(image)], [], None, None, None
+    result = _predict(image, model_type)
     if "error" in result:
         raise gr.Error(f"Image prediction failed: {result['error']}")
-    return (
-        [result["original"], result["overlay"]],
-        result["split_images"],
-        result["areas"]
-    )
+    yield from _stream_result(result)
 
 
 def capture_map_and_predict(lat, lon, zoom, model_type):
-    try:
-        result = predict_map(model_type, (lat, lon), zoom)
-        if "error" in result:
-            raise gr.Error(f"Map prediction failed: {result['error']}")
-        return (
-            [result["original"], result["overlay"]],
-            result["split_images"],
-            result["areas"]
-        )
-    except Exception as e:
-        raise gr.Error(f"Map prediction failed: {str(e)}")
+    # predict_map runs in a worker thread so the capture can be shown while the model runs
+    events = queue.Queue()
+
+    def run():
+        try:
+            result = predict_map(
+                model_type, (float(lat), float(lon)), zoom,
+                predict=_predict,
+                predict_many=_predict_many,
+                on_original=lambda image: events.put(("original", image))
+            )
+        except Exception as e:
+            result = {"error": str(e)}
+        events.put(("result", result))
+
+    threading.Thread(target=run, name="map-capture", daemon=True).start()
+    while True:
+        kind, value = events.get()
+        if kind == "original":
+            yield [display_file(value)], [], None, None, None
+            continue
+        if "error" in value:
+            raise gr.Error(f"Map prediction failed: {value['error']}")
+        yield from _stream_result(value)
+        return
 
 
 def load_and_predict_test_image(model_type, image_path):
     image = Image.open(image_path).convert("RGB")
-    return predict_uploaded_image(model_type, image)
+    yield from predict_uploaded_image(model_type, image)
 
 
 with gr.Blocks() as demo:
@@ -107,7 +193,7 @@ with gr.Blocks() as demo:
 
     with gr.Row():
         input_type = gr.Radio(["Upload Image", "Capture from Map"], value="Upload Image", label="Input Method")
-        model_type = gr.Radio(["YOLOv11", "UNet", "MaskRCNN"], value="YOLOv11", label="Select Segmentation Model")
+        model_type = gr.Radio(["YOLOv11", "UNet", "MaskRCNN", ENSEMBLE], value="YOLOv11", label="Select Segmentation Model")
 
     image_input = gr.Image(label="Upload Image", type="pil", visible=True)
 
@@ -141,7 +227,11 @@ with gr.Blocks() as demo:
         gr.Markdown("### 📊 Class-wise Segmented Outputs")
         classwise_gallery = gr.Gallery(label="Per-Class Segmentation", columns=3, rows=2)
 
-    area_json = gr.JSON(label="📐 Class-wise Area Breakdown")
+    with gr.Row():
+        area_json = gr.JSON(label="📐 Class-wise Area Breakdown")
+        timings_json = gr.JSON(label="⏱️ Stage Timings", visible=config.SHOW_TIMINGS)
+
+    mask_download = gr.File(label="⬇️ Full-resolution class mask")
 
     def toggle_input(choice):
         show_upload = choice == "Upload Image"
@@ -163,7 +253,7 @@ with gr.Blocks() as demo:
     predict_btn.click(
         predict_uploaded_image,
         [model_type, image_input],
-        [orig_pred_gallery, classwise_gallery, area_json]
+        [orig_pred_gallery, classwise_gallery, area_json, timings_json, mask_download]
     )
 
     refresh_map_btn.click(
@@ -173,14 +263,18 @@ with gr.Blocks() as demo:
     )
 
     map_predict_btn.click(
-        lambda lat, lon, zoom, model_type: capture_map_and_predict(float(lat), float(lon), zoom, model_type),
+        capture_map_and_predict,
         [lat_input, lon_input, zoom_input, model_type],
-        [orig_pred_gallery, classwise_gallery, area_json]
+        [orig_pred_gallery, classwise_gallery, area_json, timings_json, mask_download]
     )
 
-    test1.select(lambda model: load_and_predict_test_image(model, "assets/test_images/f1.jpg"), [model_type], [orig_pred_gallery, classwise_gallery, area_json])
-    test2.select(lambda model: load_and_predict_test_image(model, "assets/test_images/f2.jpg"), [model_type], [orig_pred_gallery, classwise_gallery, area_json])
-    test3.select(lambda model: load_and_predict_test_image(model, "assets/test_images/f3.jpg"), [model_type], [orig_pred_gallery, classwise_gallery, area_json])
+    test1.select(partial(load_and_predict_test_image, image_path="assets/test_images/f1.jpg"), [model_type], [orig_pred_gallery, classwise_gallery, area_json, timings_json, mask_download])
+    test2.select(partial(load_and_predict_test_image, image_path="assets/test_images/f2.jpg"), [model_type], [orig_pred_gallery, classwise_gallery, area_json, timings_json, mask_download])
+    test3.select(partial(load_and_predict_test_image, image_path="assets/test_images/f3.jpg"), [model_type], [orig_pred_gallery, classwise_gallery, area_json, timings_json, mask_download])
 
 if __name__ == "__main__":
+    # Let concurrent requests reach the scheduler so they can be batched together
+    demo.queue(default_concurrency_limit=config.SCHEDULER_MAX_QUEUE)
+    if config.OVERLAY_TILES_ENABLED:
+        OverlayTileServer().start()
     demo.launch()
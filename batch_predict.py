@@ -0,0 +1,227 @@
+# batch_predict.py
+"""
+Headless batch segmentation of image directories or file lists.
+
+    python batch_predict.py scenes/ --model UNet --output out/ --workers 4
+    python batch_predict.py @files.txt --model YOLOv11 --format npz --overlays
+
+Work is spread over a process pool; each worker loads its model once and is
+limited to --threads-per-worker framework threads so workers do not fight over
+cores. Class masks go to <output>/masks as palettized PNG (or NPZ), per-image
+areas to <output>/areas.jsonl and areas.csv. Re-running skips images that
+already have an areas.jsonl row and a mask.
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp"}
+THREAD_ENV = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+              "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"]
+
+
+def collect_inputs(inputs):
+    """
+    (path, relative name) for every image under the given files, directories
+    and @list files. Directory contents are named relative to the directory,
+    listed and explicit files relative to their deepest common directory;
+    names that still collide get a ~2, ~3, ... suffix.
+    """
+    found, loose = [], []
+    for item in inputs:
+        if item.startswith("@"):
+            with open(item[1:]) as f:
+                loose += [line.strip() for line in f if line.strip()]
+        elif os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                        path = os.path.join(root, name)
+                        found.append((path, os.path.relpath(path, item)))
+        else:
+            loose.append(item)
+
+    if loose:
+        common = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in loose])
+        found += [(path, os.path.relpath(os.path.abspath(path), common)) for path in loose]
+
+    entries, paths, names = [], set(), set()
+    for path, relative in sorted(found, key=lambda entry: (entry[1], entry[0])):
+        if os.path.abspath(path) in paths:
+            continue  # listed twice
+        paths.add(os.path.abspath(path))
+        stem, ext = os.path.splitext(relative)
+        suffix = 1
+        while relative in names:
+            suffix += 1
+            relative = f"{stem}~{suffix}{ext}"
+        names.add(relative)
+        entries.append((path, relative))
+    return sorted(entries, key=lambda entry: entry[1])
+
+
+def mask_path(output, relative, fmt):
+    return os.path.join(output, "masks", os.path.splitext(relative)[0] + f".{fmt}")
+
+
+def _init_worker(threads):
+    # Runs before any framework is imported in the spawned worker
+    for name in THREAD_ENV:
+        os.environ[name] = str(threads)
+    import config
+    config.CPU_INTRA_OP_THREADS = threads
+    config.CPU_INTER_OP_THREADS = 1
+    config.SCHEDULER_ENABLED = False
+    config.EXECUTION_MODE = "thread"  # already one process per worker
+    config.RESULT_CACHE_SIZE = 0
+
+
+def _process_chunk(chunk, model_type, output, fmt, overlays):
+    import numpy as np
+    from PIL import Image
+    from utils.predictor import predict_images
+    from utils.rendering import palettized
+
+    images, rows = [], []
+    for path, relative in chunk:
+        try:
+            images.append(Image.open(path).convert("RGB"))
+        except OSError as e:
+            rows.append({"image": relative, "error": str(e)})
+            images.append(None)
+
+    loaded = [image for image in images if image is not None]
+    results = iter(predict_images(loaded, model_type))
+
+    for (path, relative), image in zip(chunk, images):
+        if image is None:
+            continue
+        result = next(results)
+        if "error" in result:
+            rows.append({"image": relative, "error": result["error"]})
+            continue
+
+        target = mask_path(output, relative, fmt)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.tmp"
+        if fmt == "npz":
+            with open(tmp, "wb") as f:
+                np.savez_compressed(f, mask=result["mask"])
+        else:
+            palettized(result["mask"]).save(tmp, format="PNG", optimize=True)
+        os.replace(tmp, target)  # the mask only appears once complete, so resumes never see partial files
+
+        if overlays:
+            overlay_path = os.path.join(output, "overlays", os.path.splitext(relative)[0] + ".jpg")
+            os.makedirs(os.path.dirname(overlay_path), exist_ok=True)
+            result["overlay"].convert("RGB").save(overlay_path, quality=85)
+
+        class_pixels = {cls: area["pixels"] for cls, area in result["areas"].items()}
+        rows.append({"image": relative, "pixels": result["mask"].size, **class_pixels})
+    return rows
+
+
+def read_rows(output):
+    """Latest areas.jsonl row per image name."""
+    rows = {}
+    jsonl_path = os.path.join(output, "areas.jsonl")
+    if os.path.exists(jsonl_path):
+        with open(jsonl_path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # line cut short by an interrupted run
+                rows[row["image"]] = row
+    return rows
+
+
+def write_csv(output):
+    """Rebuild areas.csv from areas.jsonl (last entry per image wins)."""
+    from config import CLASSES
+
+    rows = read_rows(output)
+    with open(os.path.join(output, "areas.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["image", "pixels", *CLASSES, "error"], extrasaction="ignore")
+        writer.writeheader()
+        for name in sorted(rows):
+            writer.writerow(rows[name])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-segment directories or lists of images.")
+    parser.add_argument("inputs", nargs="+", help="image files, directories, or @file lists")
+    parser.add_argument("--model", default="YOLOv11", choices=["YOLOv11", "UNet", "MaskRCNN"])
+    parser.add_argument("--output", default="batch_output")
+    parser.add_argument("--format", default="png", choices=["png", "npz"], help="class mask format")
+    parser.add_argument("--overlays", action="store_true", help="also save blended overlays as JPEG")
+    parser.add_argument("--workers", type=int, default=max((os.cpu_count() or 2) // 2, 1))
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="framework threads per worker (default: cores / workers)")
+    parser.add_argument("--batch-size", type=int, default=4, help="images per forward pass")
+    parser.add_argument("--force", action="store_true", help="recompute images that are already done")
+    args = parser.parse_args(argv)
+
+    entries = collect_inputs(args.inputs)
+    # Masks are written before their row, so only a row proves an image finished
+    rows = {} if args.force else read_rows(args.output)
+    todo = [
+        e for e in entries
+        if e[1] not in rows or "error" in rows[e[1]]
+        or not os.path.exists(mask_path(args.output, e[1], args.format))
+    ]
+    print(f"{len(entries)} images, {len(entries) - len(todo)} already done, {len(todo)} to process", file=sys.stderr)
+    os.makedirs(args.output, exist_ok=True)
+    if not todo:
+        write_csv(args.output)
+        return 0
+
+    threads = args.threads_per_worker or max((os.cpu_count() or 1) // args.workers, 1)
+    chunks = [todo[i:i + args.batch_size] for i in range(0, len(todo), args.batch_size)]
+    done = failed = 0
+    start = time.perf_counter()
+
+    with open(os.path.join(args.output, "areas.jsonl"), "a") as areas_file, ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(threads,)
+    ) as pool:
+        futures = {
+            pool.submit(_process_chunk, chunk, args.model, args.output, args.format, args.overlays): chunk
+            for chunk in chunks
+        }
+        for future in as_completed(futures):
+            try:
+                rows = future.result()
+            except Exception as e:
+                # No rows are written, so these images are retried on the next run
+                print(f"\nWorker failed: {e}", file=sys.stderr)
+                failed += len(futures[future])
+                done += len(futures[future])
+            else:
+                for row in rows:
+                    areas_file.write(json.dumps(row) + "\n")
+                    failed += "error" in row
+                areas_file.flush()
+                done += len(rows)
+
+            elapsed = time.perf_counter() - start
+            rate = done / elapsed if elapsed > 0 else 0.0
+            eta = (len(todo) - done) / rate if rate > 0 else float("inf")
+            print(f"\r{done}/{len(todo)} images  {rate:.2f} img/s  ETA {eta:.0f}s  errors {failed}",
+                  end="", file=sys.stderr)
+
+    print(file=sys.stderr)
+    write_csv(args.output)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
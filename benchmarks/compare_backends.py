@@ -0,0 +1,128 @@
+# compare_backends.py
+"""
+Accuracy parity and latency of each inference backend against the reference one.
+
+    python -m benchmarks.compare_backends --models UNet --output backends.json
+
+For every model the first backend in utils.backends.BACKENDS is the reference.
+Each candidate is scored by mean class IoU of its masks against the reference
+masks on the bundled test images plus seeded synthetic scenes, and timed on
+predict_mask. The fastest backend whose mean IoU clears --min-iou is reported
+as recommended.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import numpy as np
+from PIL import Image
+from config import CLASSES, UNLABELED
+from utils.backends import BACKENDS, artifact_path
+from utils.models import load_model, weights_path
+from benchmarks.run_benchmarks import synthetic_image
+
+
+def mask_iou(reference, candidate):
+    """
+    Mean IoU over the classes present in either mask. A pixel left unlabeled
+    by one backend but not the other counts against the class it has.
+    """
+    ious = []
+    for idx in range(len(CLASSES)):
+        ref, cand = reference == idx, candidate == idx
+        union = np.count_nonzero(ref | cand)
+        if union:
+            ious.append(np.count_nonzero(ref & cand) / union)
+    return float(np.mean(ious)) if ious else 1.0
+
+
+def load_images(sizes, seed):
+    images = [Image.open(path).convert("RGB") for path in sorted(glob.glob(os.path.join("assets", "test_images", "*.jpg")))]
+    images += [synthetic_image(size, seed=seed + i) for i, size in enumerate(sizes)]
+    return images
+
+
+def _masks_and_latency(predictor, images, iterations):
+    masks, samples = [], []
+    for image in images:
+        try:
+            masks.append(predictor.predict_mask(image))
+        except ValueError:
+            masks.append(np.full((image.size[1], image.size[0]), UNLABELED, dtype=np.uint8))
+    for _ in range(iterations):
+        for image in images:
+            start = time.perf_counter()
+            try:
+                predictor.predict_mask(image)
+            except ValueError:
+                pass
+            samples.append(time.perf_counter() - start)
+    return masks, samples
+
+
+def compare_model(name, images, iterations, min_iou):
+    reference_backend, *candidates = BACKENDS[name]
+    rows = []
+
+    reference = load_model(name, reference_backend)
+    reference_masks, samples = _masks_and_latency(reference, images, iterations)
+    del reference
+    rows.append({"backend": reference_backend, "mean_iou": 1.0, "min_iou": 1.0,
+                 "p50_ms": float(np.percentile(samples, 50) * 1000)})
+
+    for backend in candidates:
+        path = artifact_path(weights_path(name), backend)
+        if not os.path.exists(path):
+            rows.append({"backend": backend, "error": f"missing artifact {path}, run utils.export_models"})
+            continue
+        try:
+            predictor = load_model(name, backend)
+            masks, samples = _masks_and_latency(predictor, images, iterations)
+            del predictor
+        except Exception as e:
+            rows.append({"backend": backend, "error": str(e)})
+            continue
+        ious = [mask_iou(ref, cand) for ref, cand in zip(reference_masks, masks)]
+        rows.append({"backend": backend, "mean_iou": float(np.mean(ious)), "min_iou": float(np.min(ious)),
+                     "p50_ms": float(np.percentile(samples, 50) * 1000)})
+
+    eligible = [row for row in rows if "error" not in row and row["mean_iou"] >= min_iou]
+    recommended = min(eligible, key=lambda row: row["p50_ms"])["backend"]
+    return {"model": name, "reference": reference_backend, "recommended": recommended, "backends": rows}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare inference backends for accuracy and latency.")
+    parser.add_argument("--models", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[512, 768])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-iou", type=float, default=0.95, help="mean IoU a backend needs to be recommended")
+    parser.add_argument("--output", help="write results as JSON to this file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    images = load_images(args.sizes, args.seed)
+    report = []
+    for name in args.models:
+        result = compare_model(name, images, args.iterations, args.min_iou)
+        report.append(result)
+        for row in result["backends"]:
+            if "error" in row:
+                print(f"{name:>9} {row['backend']:>16}  skipped: {row['error']}", file=sys.stderr)
+            else:
+                print(f"{name:>9} {row['backend']:>16}  mIoU {row['mean_iou']:.4f}  p50 {row['p50_ms']:9.2f} ms",
+                      file=sys.stderr)
+        print(f"{name:>9} recommended backend: {result['recommended']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+# run_benchmarks.py
+"""
+CPU benchmarks for the prediction pipeline, one stage at a time.
+
+    python -m benchmarks.run_benchmarks --output bench.json
+    python -m benchmarks.run_benchmarks --real --models UNet --sizes 768
+    python -m benchmarks.run_benchmarks --output new.json --compare bench.json
+
+Every (stage, model, size) case runs in a fresh spawned process so its peak
+RSS is measured in isolation. Inputs are synthetic and seeded, models are
+numpy stubs unless --real is given (which loads the weights in models/).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+MODEL_TYPES = ["YOLOv11", "UNet", "MaskRCNN"]
+STUB_STAGES = ["preprocess", "inference", "mask_assembly", "overlay", "split_by_class",
+               "calculate_area", "end_to_end"]
+REAL_STAGES = ["inference", "overlay", "split_by_class", "calculate_area", "end_to_end"]
+THREAD_ENV = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS"]
+
+
+def synthetic_image(size, seed=0):
+    """Seeded size x size RGB image with blobby regions rather than pure noise."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (max(size // 32, 2), max(size // 32, 2), 3), dtype=np.uint8)
+    image = Image.fromarray(coarse).resize((size, size), Image.BILINEAR)
+    noise = rng.integers(-12, 13, (size, size, 3))
+    return Image.fromarray(np.clip(np.asarray(image, dtype=np.int16) + noise, 0, 255).astype(np.uint8))
+
+
+def _peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _summarize(samples, case, pixels):
+    samples = np.asarray(samples)
+    total = samples.sum()
+    return dict(
+        case,
+        n=len(samples),
+        mean_ms=float(samples.mean() * 1000),
+        min_ms=float(samples.min() * 1000),
+        p50_ms=float(np.percentile(samples, 50) * 1000),
+        p90_ms=float(np.percentile(samples, 90) * 1000),
+        p99_ms=float(np.percentile(samples, 99) * 1000),
+        throughput_per_s=float(len(samples) / total) if total > 0 else None,
+        megapixels_per_s=float(len(samples) * pixels / total / 1e6) if total > 0 else None,
+        peak_rss_bytes=_peak_rss_bytes()
+    )
+
+
+def _time(fn, iterations, warmup):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _tile_fetch_stage(case):
+    import config
+    from utils import tile_fetcher
+    from utils.tile_cache import TileCache
+    from benchmarks.tile_server import LocalTileServer
+
+    cached = case["stage"] == "tile_fetch_cached"
+    num_tiles = max(case["size"] // 256, 1)
+    with LocalTileServer(latency=case["latency"]) as server, tempfile.TemporaryDirectory() as tmp:
+        config.TILE_URL = server.url
+        tile_fetcher.set_tile_cache(TileCache(os.path.join(tmp, "tiles.mbtiles")) if cached else None)
+        fn = lambda: tile_fetcher.fetch_stitched_map(22.9749, 76.2168, 16, num_tiles=num_tiles)
+        if cached:
+            fn()
+        samples = _time(fn, case["iterations"], case["warmup"])
+        tile_fetcher.set_tile_cache(None)
+    return _summarize(samples, case, (num_tiles * 256) ** 2)
+
+
+def run_case(case):
+    """Run one benchmark case in the current process and return its summary."""
+    from utils.rendering import blend_overlay
+    from utils.image_processing import split_by_class
+    from utils.area_calculator import calculate_area
+
+    stage, model_type, size = case["stage"], case["model"], case["size"]
+    iterations, warmup = case["iterations"], case["warmup"]
+
+    if stage.startswith("tile_fetch"):
+        return _tile_fetch_stage(case)
+
+    image = synthetic_image(size, seed=case["seed"])
+    if case["real"]:
+        from utils.models import load_model
+        predictor = load_model(model_type)
+    else:
+        from benchmarks.stubs import StubPredictor
+        predictor = StubPredictor(model_type, seed=case["seed"])
+
+    mask = predictor.predict_mask(image)
+
+    def end_to_end():
+        _, result_mask = predictor.predict(image)
+        calculate_area(result_mask)
+        list(split_by_class(result_mask))
+
+    stages = {
+        "inference": lambda: predictor.predict_mask(image),
+        "overlay": lambda: blend_overlay(image, mask, alpha=0.5),
+        "split_by_class": lambda: list(split_by_class(mask)),
+        "calculate_area": lambda: calculate_area(mask),
+        "end_to_end": end_to_end,
+    }
+    if not case["real"]:
+        array = predictor.preprocess(image)
+        output = predictor.infer(array)
+        stages["preprocess"] = lambda: predictor.preprocess(image)
+        stages["inference"] = lambda: predictor.infer(array)
+        stages["mask_assembly"] = lambda: predictor.assemble(output, image.size)
+
+    return _summarize(_time(stages[stage], iterations, warmup), case, size * size)
+
+
+def build_cases(args):
+    base = dict(iterations=args.iterations, warmup=args.warmup, seed=args.seed,
+                real=args.real, latency=args.tile_latency)
+    cases = []
+    for size in args.sizes:
+        if not args.skip_tiles:
+            for stage in ("tile_fetch", "tile_fetch_cached"):
+                cases.append(dict(base, stage=stage, model="-", size=size))
+        for model_type in args.models:
+            for stage in (REAL_STAGES if args.real else STUB_STAGES):
+                cases.append(dict(base, stage=stage, model=model_type, size=size))
+    return cases
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "threads": args.threads,
+        "mode": "real" if args.real else "stub",
+    }
+
+
+def compare(current, baseline_path, threshold):
+    """Print p50 changes against a previous run; return the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r["stage"], r["model"], r["size"])
+    previous = {key(r): r for r in baseline["results"]}
+
+    regressions = 0
+    for result in current["results"]:
+        old = previous.get(key(result))
+        if old is None or not old["p50_ms"]:
+            continue
+        change = result["p50_ms"] / old["p50_ms"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{result['stage']:>18} {result['model']:>9} {result['size']:>5}  "
+              f"{old['p50_ms']:9.2f} -> {result['p50_ms']:9.2f} ms  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the segmentation pipeline stage by stage.")
+    parser.add_argument("--models", nargs="+", default=MODEL_TYPES, choices=MODEL_TYPES)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[512, 768, 2048])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=None, help="pin BLAS/OpenMP/TF thread counts")
+    parser.add_argument("--real", action="store_true", help="use the real models instead of stubs")
+    parser.add_argument("--skip-tiles", action="store_true", help="skip the tile fetch stages")
+    parser.add_argument("--tile-latency", type=float, default=0.02, help="seconds added per stand-in tile")
+    parser.add_argument("--output", help="write results as JSON to this file (default: stdout)")
+    parser.add_argument("--compare", help="previous JSON results to compare p50 latencies against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.threads:
+        for name in THREAD_ENV:
+            os.environ[name] = str(args.threads)
+
+    report = {"meta": metadata(args), "results": []}
+    context = multiprocessing.get_context("spawn")
+    for case in build_cases(args):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            try:
+                result = pool.submit(run_case, case).result()
+            except Exception as e:
+                result = dict(case, error=str(e))
+        report["results"].append(result)
+        if "error" in result:
+            print(f"{case['stage']:>18} {case['model']:>9} {case['size']:>5}  failed: {result['error']}", file=sys.stderr)
+        else:
+            print(f"{case['stage']:>18} {case['model']:>9} {case['size']:>5}  p50 {result['p50_ms']:9.2f} ms  "
+                  f"p99 {result['p99_ms']:9.2f} ms  rss {result['peak_rss_bytes'] / 2**20:7.1f} MiB", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if args.compare:
+        return 1 if compare(report, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+# stubs.py
+
+import numpy as np
+from PIL import Image
+from config import CLASSES
+from utils.rendering import blend_overlay
+from utils.mask_fusion import fuse_dense
+
+# input size used by each real predictor (None = native resolution)
+INPUT_SIZES = {"YOLOv11": (512, 512), "UNet": (256, 256), "MaskRCNN": None}
+
+
+class StubPredictor:
+    """
+    Deterministic numpy stand-in with the same interface as the real
+    predictors, so the pipeline around the model can be benchmarked
+    without the ML frameworks or weights. Semantic models (UNet) produce
+    per-pixel class scores; instance models (YOLOv11, MaskRCNN) produce
+    instance masks that are fused into a semantic mask.
+    """
+
+    def __init__(self, model_type, seed=0):
+        self.model_type = model_type
+        self.instance_based = model_type != "UNet"
+        size = INPUT_SIZES[model_type]
+        if size is not None:
+            self.input_size = size
+        rng = np.random.default_rng(seed)
+        self.weights = rng.standard_normal((3, len(CLASSES))).astype(np.float32)
+
+    def preprocess(self, image):
+        size = getattr(self, "input_size", None)
+        if size is not None:
+            image = image.resize(size)
+        return np.asarray(image, dtype=np.float32) / 255.0
+
+    def infer(self, array):
+        """Class scores (H, W, C), or (masks, classes) for instance models."""
+        scores = array @ self.weights
+        if not self.instance_based:
+            return scores
+        labels = np.argmax(scores, axis=-1)
+        classes = np.unique(labels).astype(np.uint8)
+        masks = np.stack([(labels == cls).astype(np.float32) for cls in classes])
+        return masks, classes
+
+    def assemble(self, output, size):
+        """Semantic mask at size=(w, h) from the raw model output."""
+        if self.instance_based:
+            masks, classes = output
+            semantic_mask = fuse_dense(masks, classes, np.ones(len(classes), dtype=np.float32))
+        else:
+            semantic_mask = np.argmax(output, axis=-1).astype(np.uint8)
+        if (semantic_mask.shape[1], semantic_mask.shape[0]) != size:
+            semantic_mask = np.array(Image.fromarray(semantic_mask).resize(size, Image.NEAREST))
+        return semantic_mask
+
+    def predict_mask(self, image):
+        return self.assemble(self.infer(self.preprocess(image)), image.size)
+
+    def predict(self, image):
+        mask = self.predict_mask(image)
+        return blend_overlay(image, mask, alpha=0.5), mask
@@ -0,0 +1,59 @@
+# tile_server.py
+
+import io
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from PIL import Image
+
+
+class _TileHandler(BaseHTTPRequestHandler):
+    """Serves deterministic synthetic JPEG tiles at /{z}/{x}/{y}."""
+
+    latency = 0.0
+
+    def do_GET(self):
+        try:
+            z, x, y = (int(part) for part in self.path.strip("/").split("/")[:3])
+        except ValueError:
+            self.send_error(404)
+            return
+
+        rng = np.random.default_rng(hash((z, x, y)) & 0xFFFFFFFF)
+        tile = rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(tile).save(buffer, "JPEG", quality=85)
+        body = buffer.getvalue()
+
+        if self.latency:
+            threading.Event().wait(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalTileServer:
+    """
+    Stand-in for the Esri tile server on 127.0.0.1, with optional per-tile
+    latency to mimic network round-trips. Use as a context manager; url is
+    a config.TILE_URL-style template.
+    """
+
+    def __init__(self, latency=0.0):
+        handler = type("TileHandler", (_TileHandler,), {"latency": latency})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/{{z}}/{{x}}/{{y}}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,4 +1,6 @@
 #config.py
+import os
+
 CLASSES = ["Buildings", "Hills", "Land", "Road", "Vegetation", "Water"]
 CLASS_COLORS = {
     "Buildings": (235, 16, 16),
@@ -8,3 +10,104 @@ CLASS_COLORS = {
     "Vegetation": (28, 106, 11),
     "Water": (19, 158, 244)
 }
+
+# Tile source ({z}/{x}/{y} placeholders) and on-disk tile cache
+TILE_URL = os.environ.get(
+    "TILE_URL",
+    "https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}"
+)
+TILE_CACHE_PATH = os.environ.get("TILE_CACHE_PATH", os.path.join("cache", "tiles.mbtiles"))
+TILE_CACHE_MAX_BYTES = 512 * 1024 * 1024  # LRU eviction above this size
+TILE_CACHE_TTL = None  # seconds, None keeps tiles until evicted
+TILE_OFFLINE = os.environ.get("TILE_OFFLINE", "0") == "1"  # serve cached tiles only
+
+# Concurrent tile download
+TILE_FETCH_WORKERS = 8  # bounded worker pool sharing one keep-alive session
+TILE_REQUEST_TIMEOUT = 10  # seconds per HTTP request
+TILE_FETCH_RETRIES = 2  # extra attempts per tile, with exponential backoff
+TILE_FETCH_BACKOFF = 0.25  # seconds before the first retry
+TILE_FETCH_DEADLINE = 20  # seconds for a whole capture, missing tiles are left blank
+
+# Region (bounding box) segmentation
+REGION_WINDOW = 512  # window size for predictors without a native input size
+REGION_OVERLAP = 64  # pixels shared by neighbouring windows, blended at the seams
+REGION_PREVIEW_SIZE = 2048  # max side of the returned original/overlay previews
+
+# Model loading
+MODEL_DIR = "models"
+MODEL_WARMUP = []  # models to load and warm up in the background at startup, e.g. ["YOLOv11"]
+MODEL_IDLE_TIMEOUT = None  # seconds before an unused model is evicted, None keeps models loaded
+
+# Batched inference
+PREDICT_BATCH_SIZE = 8  # images per forward pass in predict_images
+
+# Prediction result cache
+RESULT_CACHE_SIZE = 64  # class masks kept in memory, 0 disables the cache
+RESULT_CACHE_DIR = None  # e.g. os.path.join("cache", "results") to persist masks on disk
+
+# Map captures reuse per-tile predictions, so panning only runs the model on new tiles
+MAP_TILE_REUSE = True
+MAP_TILE_HALO = 128  # context pixels around each tile fed to the model (window = 256 + 2 * halo)
+MAP_TILE_CACHE_SIZE = 1024  # tile masks kept in memory (64 KB each)
+MAP_TILE_CACHE_DIR = None  # e.g. os.path.join("cache", "map_tiles") to persist tile masks on disk
+
+# Segmentation overlay tiles shown as a layer on the Folium map
+OVERLAY_TILES_ENABLED = True  # publish map captures and regions as XYZ overlay tiles
+OVERLAY_TILE_DIR = os.path.join("cache", "overlays")  # one .mbtiles store per model
+OVERLAY_MIN_ZOOM = 10  # lowest zoom level built by majority downsampling
+OVERLAY_TILE_PORT = int(os.environ.get("OVERLAY_TILE_PORT", "8765"))
+OVERLAY_TILE_URL = os.environ.get("OVERLAY_TILE_URL", f"http://127.0.0.1:{OVERLAY_TILE_PORT}")
+OVERLAY_TILE_MAX_AGE = 60  # seconds browsers may reuse a tile before revalidating (ETag)
+
+# Ensemble mode: all models run in parallel on the same input and vote per pixel
+ENSEMBLE_MODELS = ["YOLOv11", "UNet", "MaskRCNN"]
+ENSEMBLE_WEIGHTS = None  # e.g. {"YOLOv11": 1.0, "UNet": 1.5, "MaskRCNN": 1.0}, None is a plain majority vote
+# Members run at once in-process; they share the process-wide framework thread pools
+# (CPU_INTRA_OP_THREADS), so 1 runs them one after another. None runs all in parallel.
+ENSEMBLE_PARALLEL = None
+
+# Request scheduling (micro-batching behind the Gradio handlers)
+SCHEDULER_ENABLED = True
+SCHEDULER_MAX_BATCH = 4  # requests coalesced into one forward pass
+SCHEDULER_MAX_WAIT = 0.02  # seconds to wait for more requests after the first
+SCHEDULER_MAX_QUEUE = 32  # waiting requests per model before rejecting new ones
+
+# Result payloads sent to the browser
+DISPLAY_MAX_SIZE = 1024  # longest side of the original/overlay/class images shown in the UI
+DISPLAY_FORMAT = "jpeg"  # "jpeg" or "webp" for the original and overlay
+DISPLAY_QUALITY = 80
+DISPLAY_FILE_TTL = 3600  # seconds before written result files are deleted
+MASK_DOWNLOAD_FORMAT = "png"  # full-resolution mask download: "png" (palettized), "npz" or "rle" (JSON)
+
+# Per-request profiling
+PROFILING_ENABLED = os.environ.get("PROFILING", "0") == "1"  # collect per-stage timings
+PROFILING_LOG = False  # also log each request profile as one JSON line (logger "satseg.profile")
+SHOW_TIMINGS = PROFILING_ENABLED  # show the profile next to the area breakdown in the UI
+
+# Mask value for pixels no instance covers (excluded from areas, left unpainted in overlays)
+UNLABELED = 255
+UNLABELED_COLOR = (255, 255, 255)  # in palettized mask PNGs, distinct from every class color
+
+# Region labels drawn on the UNet overlay (computed on the 256x256 prediction)
+ANNOTATION_MIN_AREA = 32  # smallest labelled region, in prediction pixels
+ANNOTATION_MAX_PER_CLASS = 8  # labels kept per class, largest regions first
+
+# CPU inference backends (see utils/backends.py; exported ones need utils/export_models.py first)
+MODEL_BACKENDS = {
+    "YOLOv11": os.environ.get("YOLO_BACKEND", "pytorch"),
+    "UNet": os.environ.get("UNET_BACKEND", "keras"),
+    "MaskRCNN": os.environ.get("MASKRCNN_BACKEND", "detectron2"),
+}
+CPU_INTRA_OP_THREADS = None  # threads inside one op, None keeps the framework default
+CPU_INTER_OP_THREADS = None  # ops run in parallel, None keeps the framework default
+
+# Model execution: "thread" runs models inside this process, "process" gives each
+# model its own worker process (see utils/workers.py) so a crash cannot take down the UI
+EXECUTION_MODE = os.environ.get("EXECUTION_MODE", "thread")
+WORKER_THREADS = None  # e.g. {"YOLOv11": 2, "UNet": 2, "MaskRCNN": 4}, None splits the cores evenly
+WORKER_CORES = None  # e.g. {"YOLOv11": [0, 1]}, explicit core sets per worker
+WORKER_PIN_CORES = True  # without WORKER_CORES, pin workers to consecutive disjoint core blocks
+WORKER_START_TIMEOUT = 300  # seconds for a worker to load its model
+WORKER_REQUEST_TIMEOUT = 120  # seconds before a busy worker is considered hung and killed
+WORKER_HEALTH_INTERVAL = 10  # seconds between health checks of idle workers
+WORKER_HEALTH_TIMEOUT = 5  # seconds a ping may take
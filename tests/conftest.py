@@ -0,0 +1,20 @@
+import pytest
+import config
+import utils.tile_fetcher as tile_fetcher
+from benchmarks.tile_server import LocalTileServer
+
+
+@pytest.fixture(scope="session")
+def tile_server():
+    with LocalTileServer() as server:
+        yield server
+
+
+@pytest.fixture
+def fetcher(tile_server, monkeypatch):
+    """tile_fetcher pointed at the local tile server; the shared cache is restored afterwards."""
+    monkeypatch.setattr(config, "TILE_URL", tile_server.url)
+    monkeypatch.setattr(config, "TILE_OFFLINE", False)
+    monkeypatch.setattr(tile_fetcher, "_tile_cache", None)
+    monkeypatch.setattr(tile_fetcher, "_tile_cache_ready", False)
+    return tile_fetcher
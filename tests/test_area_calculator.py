@@ -0,0 +1,48 @@
+import math
+import numpy as np
+import pytest
+from config import CLASSES, UNLABELED
+from utils.area_calculator import (
+    EARTH_RADIUS, TILE_SIZE, add_ground_area, calculate_area, class_ground_area, ground_resolution
+)
+
+
+def test_equator_pixels_have_the_equator_resolution():
+    zoom = 10
+    world = TILE_SIZE * 2 ** zoom
+    mask = np.zeros((2, 4), dtype=np.uint8)
+    mask[:, 2:] = 5
+
+    # Two rows straddling the equator are ~ ground_resolution(0)² each
+    areas = class_ground_area(mask, zoom, pixel_y0=world // 2 - 1)
+    expected = 4 * ground_resolution(0.0, zoom) ** 2
+    assert areas[0] == pytest.approx(expected, rel=1e-6)
+    assert areas[5] == pytest.approx(expected, rel=1e-6)
+    assert ground_resolution(0.0, 0) == pytest.approx(2 * math.pi * EARTH_RADIUS / TILE_SIZE)
+
+
+def test_rows_are_weighted_by_latitude_and_chunking_does_not_matter():
+    zoom = 3
+    mask = np.random.default_rng(0).integers(0, len(CLASSES), (600, 7), dtype=np.uint8)
+    mask[::9] = UNLABELED
+
+    areas = class_ground_area(mask, zoom, pixel_y0=100)
+    per_row = [class_ground_area(mask[i:i + 1], zoom, pixel_y0=100 + i) for i in range(mask.shape[0])]
+    np.testing.assert_allclose(areas, np.sum(per_row, axis=0), rtol=1e-9)
+
+    # Pixels nearer the pole cover less ground
+    north = class_ground_area(np.zeros((1, 1), dtype=np.uint8), zoom, pixel_y0=100)[0]
+    south = class_ground_area(np.zeros((1, 1), dtype=np.uint8), zoom, pixel_y0=1000)[0]
+    assert north < south
+
+
+def test_calculate_area_has_one_schema():
+    mask = np.array([[0, 0, 3], [UNLABELED, 3, 3]], dtype=np.uint8)
+
+    areas = calculate_area(mask)
+    assert areas["Buildings"] == {"pixels": 2, "area_m2": None}
+    assert areas["Road"] == {"pixels": 3, "area_m2": None}
+
+    with_zoom = calculate_area(mask, zoom=15, pixel_y0=4096)
+    assert add_ground_area(areas, mask, zoom=15, pixel_y0=4096) == with_zoom
+    assert with_zoom["Road"]["area_m2"] > 0
@@ -0,0 +1,29 @@
+import numpy as np
+from utils.image_processing import TITLE_HEIGHT, split_by_class
+
+
+def test_one_bit_class_images_are_white_on_black():
+    mask = np.zeros((60, 80), dtype=np.uint8)
+    mask[:30] = 3
+
+    images = split_by_class(mask, mode="1")
+    assert len(images) == 2
+
+    for image, class_idx in zip(images, (0, 3)):
+        pixels = np.asarray(image)
+        assert image.mode == "1"
+        assert pixels.shape == (60 + TITLE_HEIGHT, 80)
+        # White banner (apart from the black label text)
+        assert pixels[:TITLE_HEIGHT, 0].all()
+        np.testing.assert_array_equal(pixels[TITLE_HEIGHT:], mask == class_idx)
+
+
+def test_palette_class_images_use_banner_background_class_indices():
+    mask = np.zeros((40, 40), dtype=np.uint8)
+    mask[10:20, 10:20] = 5
+
+    image = split_by_class(mask)[1]
+    pixels = np.asarray(image)
+    assert image.mode == "P"
+    assert pixels[0, 0] == 0
+    np.testing.assert_array_equal(pixels[TITLE_HEIGHT:], np.where(mask == 5, 2, 1))
@@ -0,0 +1,44 @@
+import numpy as np
+from config import UNLABELED
+from utils.mask_fusion import fuse_dense, fuse_votes, pairwise_agreement
+
+U = UNLABELED
+
+
+def test_majority_wins_and_unlabeled_does_not_vote():
+    masks = [
+        np.array([[1, 2, U, U]], dtype=np.uint8),
+        np.array([[1, 3, 4, U]], dtype=np.uint8),
+        np.array([[0, 3, U, U]], dtype=np.uint8),
+    ]
+    np.testing.assert_array_equal(fuse_votes(masks), [[1, 3, 4, U]])
+
+
+def test_ties_go_to_the_earliest_heaviest_mask():
+    a = np.array([[1, 1]], dtype=np.uint8)
+    b = np.array([[2, 2]], dtype=np.uint8)
+    np.testing.assert_array_equal(fuse_votes([a, b]), [[1, 1]])
+    np.testing.assert_array_equal(fuse_votes([b, a]), [[2, 2]])
+    np.testing.assert_array_equal(fuse_votes([a, b], weights=[1.0, 1.5]), [[2, 2]])
+
+
+def test_weights_can_outvote_a_majority():
+    masks = [np.full((2, 2), c, dtype=np.uint8) for c in (0, 0, 5)]
+    np.testing.assert_array_equal(fuse_votes(masks, weights=[1, 1, 3]), np.full((2, 2), 5))
+    np.testing.assert_array_equal(fuse_votes(masks, weights=[1, 1, 1.5]), np.zeros((2, 2)))
+
+
+def test_pairwise_agreement_counts_pixels_either_mask_labels():
+    masks = {
+        "a": np.array([[1, 1, U, U]], dtype=np.uint8),
+        "b": np.array([[1, 2, 3, U]], dtype=np.uint8),
+    }
+    assert pairwise_agreement(masks) == {"a/b": round(1 / 3, 4)}
+
+
+def test_fuse_dense_takes_the_most_confident_instance():
+    masks = np.zeros((2, 2, 3), dtype=np.float32)
+    masks[0, 0, :2] = 1
+    masks[1, 0, 1:] = 1
+    fused = fuse_dense(masks, classes=[4, 2], scores=[0.9, 0.6])
+    np.testing.assert_array_equal(fused, [[4, 4, 2], [U, U, U]])
@@ -0,0 +1,67 @@
+import threading
+import numpy as np
+import pytest
+import requests
+import config
+from config import UNLABELED
+from utils import overlay_tiles
+from utils.overlay_tiles import OverlayTileServer, decode_tile, get_overlay_store, mode_downsample
+
+
+@pytest.fixture
+def overlay_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "OVERLAY_TILE_DIR", str(tmp_path))
+    monkeypatch.setattr(overlay_tiles, "_stores", {})
+    monkeypatch.setattr(overlay_tiles, "_publish_locks", {})
+    return tmp_path
+
+
+def test_mode_downsample_ignores_unlabeled_and_breaks_ties_low():
+    mask = np.array([
+        [1, 1, 2, UNLABELED],
+        [3, 2, UNLABELED, UNLABELED],
+        [4, 5, 0, 0],
+        [5, 4, 0, 0],
+    ], dtype=np.uint8)
+    np.testing.assert_array_equal(mode_downsample(mask), [[1, 2], [4, 0]])
+
+
+def test_concurrent_publishes_into_one_tile_are_merged(overlay_dir):
+    zoom, origin = 12, (256 * 40, 256 * 30)
+    halves = []
+    for class_idx, columns in ((2, slice(0, 128)), (5, slice(128, 256))):
+        mask = np.full((256, 256), UNLABELED, dtype=np.uint8)
+        mask[:, columns] = class_idx
+        halves.append(mask)
+
+    for _ in range(5):
+        threads = [
+            threading.Thread(target=overlay_tiles.publish_mask, args=("UNet", mask, zoom, origin, zoom))
+            for mask in halves
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        tile = decode_tile(get_overlay_store("unet").get(zoom, 40, 30))
+        assert (tile[:, :128] == 2).all() and (tile[:, 128:] == 5).all()
+
+
+def test_async_publish_builds_lower_levels(overlay_dir):
+    mask = np.full((512, 512), 3, dtype=np.uint8)
+    written = overlay_tiles.publish_mask_async("UNet", mask, 12, (0, 0), min_zoom=11).result(10)
+    assert written == 4 + 1
+    assert (decode_tile(get_overlay_store("unet").get(11, 0, 0)) == 3).all()
+
+
+def test_server_only_opens_configured_layers(overlay_dir):
+    overlay_tiles.publish_mask("UNet", np.zeros((256, 256), dtype=np.uint8), 12, (0, 0), min_zoom=12)
+    server = OverlayTileServer(port=0).start()
+    try:
+        base = f"http://127.0.0.1:{server.port}"
+        assert requests.get(f"{base}/unet/12/0/0.png").status_code == 200
+        assert requests.get(f"{base}/bogus/12/0/0.png").status_code == 404
+    finally:
+        server.stop()
+    assert sorted(path.name for path in overlay_dir.glob("*.mbtiles")) == ["unet.mbtiles"]
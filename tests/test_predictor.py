@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from PIL import Image
+import config
+import utils.predictor as predictor
+import utils.tile_fetcher as tile_fetcher
+from utils.result_cache import PredictionCache
+
+
+class StubPredictor:
+    """Class from the red channel, shifted per model so ensemble members disagree a little."""
+
+    backend = "stub"
+
+    def __init__(self, shift):
+        self.shift = shift
+
+    def predict(self, image):
+        mask = ((np.asarray(image)[..., 0] // 43 + self.shift) % len(config.CLASSES)).astype(np.uint8)
+        return image, mask
+
+    def predict_batch(self, images):
+        return [self.predict(image) for image in images]
+
+    def predict_mask(self, image):
+        return self.predict(image)[1]
+
+
+@pytest.fixture
+def stub_models(fetcher, monkeypatch):
+    stubs = {name: StubPredictor(shift) for shift, name in enumerate(config.ENSEMBLE_MODELS)}
+    monkeypatch.setattr(config, "MODEL_BACKENDS", {name: "stub" for name in config.MODEL_BACKENDS})
+    monkeypatch.setattr(config, "OVERLAY_TILES_ENABLED", False)
+    monkeypatch.setattr(predictor.models, "get", stubs.get)
+    monkeypatch.setattr(predictor, "result_cache", None)
+    monkeypatch.setattr(predictor, "tile_results", PredictionCache(64))
+    fetcher.set_tile_cache(None)
+    return stubs
+
+
+def test_ensemble_map_capture_keeps_member_results(stub_models):
+    image = Image.fromarray(np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8))
+    expected = set(predictor.predict_image(image, predictor.ENSEMBLE))
+
+    result = predictor.predict_map(predictor.ENSEMBLE, (40.0, 2.35), 15)
+    assert "error" not in result
+    assert expected <= set(result)
+    assert set(result["model_areas"]) == set(config.ENSEMBLE_MODELS)
+    assert result["areas"]["Water"]["area_m2"] is not None
+
+
+def test_single_model_map_capture_reuses_tiles(stub_models):
+    first = predictor.predict_map("UNet", (40.0, 2.35), 15)
+    second = predictor.predict_map("UNet", (40.0, 2.35), 15)
+    assert first["tiles"]["predicted"] == 9
+    assert second["tiles"] == {"reused": 9, "predicted": 0, "failed_fetches": 0}
+    np.testing.assert_array_equal(first["mask"], second["mask"])
+
+
+def test_result_cache_hits_do_not_load_the_model(stub_models, monkeypatch):
+    loads = []
+    monkeypatch.setattr(predictor.models, "get", lambda name: loads.append(name) or stub_models[name])
+    monkeypatch.setattr(predictor, "result_cache", PredictionCache(8))
+    images = [Image.new("RGB", (32, 32), (i * 60, 0, 0)) for i in range(3)]
+
+    first = predictor.predict_image(images[0], "UNet")
+    assert loads == ["UNet"] and "cached" not in first
+    assert predictor.predict_image(images[0], "UNet")["cached"]
+    predictor.predict_images(images[:1], "UNet")
+    assert loads == ["UNet"]
+
+    # Only the uncached images of a batch need the model
+    results = predictor.predict_images(images, "UNet")
+    assert loads == ["UNet", "UNet"]
+    assert [bool(result.get("cached")) for result in results] == [True, False, False]
+
+
+def test_region_tiles_that_fail_to_fetch_stay_unlabeled(stub_models, monkeypatch):
+    zoom = 15
+    left, top = tile_fetcher.deg2pixel(40.0, 2.35, zoom)
+    right, bottom = left + 900, top + 700
+    min_lat, min_lon = _latlon(left, bottom, zoom)
+    max_lat, max_lon = _latlon(right, top, zoom)
+    bbox = (min_lat, min_lon, max_lat, max_lon)
+
+    px, py = int(left), int(top)
+    broken = (px // 256 + 1, py // 256 + 1)
+    fetch = tile_fetcher.fetch_tile_from_coords
+
+    def flaky_fetch(x, y, z, deadline=None):
+        if (x, y) == broken:
+            raise OSError("tile server error")
+        return fetch(x, y, z, deadline)
+
+    monkeypatch.setattr(tile_fetcher, "fetch_tile_from_coords", flaky_fetch)
+    result = predictor.predict_region("UNet", bbox, zoom, window=256, overlap=32)
+
+    assert result["tiles"]["failed_fetches"] == 1
+    mask = result["mask"]
+    tile_x, tile_y = broken[0] * 256 - px, broken[1] * 256 - py
+    assert (mask[tile_y:tile_y + 256, tile_x:tile_x + 256] == config.UNLABELED).all()
+    labeled = sum(area["pixels"] for area in result["areas"].values())
+    assert labeled == np.count_nonzero(mask != config.UNLABELED) > mask.size // 2
+
+
+def _latlon(px, py, zoom):
+    """Inverse of tile_fetcher.deg2pixel."""
+    world = 256 * 2 ** zoom
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * py / world))))
+    return float(lat), px / world * 360.0 - 180.0
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from utils.result_cache import PredictionCache
+
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_cached_masks_cannot_be_changed_by_callers(tmp_path, on_disk):
+    cache = PredictionCache(max_entries=1, directory=str(tmp_path) if on_disk else None)
+    mask = np.zeros((4, 4), dtype=np.uint8)
+    cache.put("a", mask)
+    mask[0, 0] = 7
+    if on_disk:
+        cache.put("b", mask)  # pushes "a" out of memory, so the next get loads it from disk
+
+    cached = cache.get("a")
+    assert cached[0, 0] == 0
+    with pytest.raises(ValueError):
+        cached[0, 0] = 7
+    assert cache.get("a")[0, 0] == 0
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = PredictionCache(max_entries=2)
+    for key in "abc":
+        cache.put(key, np.full((2, 2), ord(key), dtype=np.uint8))
+    assert cache.get("a") is None
+    assert cache.get("c")[0, 0] == ord("c")
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,26 @@
+import threading
+import pytest
+from utils.scheduler import BatchScheduler, QueueFull
+
+
+def test_requests_are_batched_and_full_queues_reject():
+    release = threading.Event()
+
+    def run_batch(images, model_type):
+        release.wait(5)
+        return [{"value": image * 2} for image in images]
+
+    scheduler = BatchScheduler(run_batch, max_batch_size=4, max_wait=0.05, max_queue=2)
+    first = scheduler.submit(1, "stub")
+    # The first batch is held in run_batch, so at most max_queue requests can wait
+    threading.Event().wait(0.2)
+    waiting = [scheduler.submit(i, "stub") for i in (2, 3)]
+    with pytest.raises(QueueFull):
+        scheduler.submit(4, "stub")
+
+    release.set()
+    assert first.result(5)["value"] == 2
+    assert [future.result(5)["value"] for future in waiting] == [4, 6]
+    stats = scheduler.stats()["stub"]
+    assert stats["requests"] == 3 and stats["rejected"] == 1
+    assert stats["batches"] == 2
@@ -0,0 +1,52 @@
+import pytest
+import config
+from utils.tile_cache import TileCache, TileNotCached
+
+
+def test_second_fetch_is_a_cache_hit(fetcher, tmp_path, monkeypatch):
+    cache = TileCache(str(tmp_path / "tiles.mbtiles"))
+    fetcher.set_tile_cache(cache)
+
+    first = fetcher.fetch_tile_bytes(10, 20, 12)
+    assert cache.stats()["misses"] == 1 and cache.stats()["tiles"] == 1
+
+    # Offline, the tile can only come from the cache
+    monkeypatch.setattr(config, "TILE_OFFLINE", True)
+    assert fetcher.fetch_tile_bytes(10, 20, 12) == first
+    assert cache.stats()["hits"] == 1
+    with pytest.raises(TileNotCached):
+        fetcher.fetch_tile_bytes(11, 20, 12)
+
+
+def test_lru_eviction_keeps_recently_read_tiles(tmp_path):
+    cache = TileCache(str(tmp_path / "tiles.mbtiles"), max_bytes=250)
+    cache.put(1, 0, 0, b"a" * 100)
+    cache.put(1, 1, 0, b"b" * 100)
+    assert cache.get(1, 0, 0) is not None
+
+    cache.put(1, 2, 0, b"c" * 100)
+    assert cache.get(1, 1, 0) is None
+    assert cache.get(1, 0, 0) == b"a" * 100
+    assert cache.get(1, 2, 0) == b"c" * 100
+    assert cache.stats()["bytes"] == 200
+
+
+def test_untracked_reads_do_not_affect_eviction(tmp_path):
+    cache = TileCache(str(tmp_path / "tiles.mbtiles"), max_bytes=250, track_access=False)
+    cache.put(1, 0, 0, b"a" * 100)
+    cache.put(1, 1, 0, b"b" * 100)
+    cache.get(1, 0, 0)
+
+    cache.put(1, 2, 0, b"c" * 100)
+    assert cache.get(1, 0, 0) is None
+    assert cache.get(1, 1, 0) is not None
+
+
+def test_disabled_cache_stays_disabled(fetcher, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "TILE_CACHE_PATH", str(tmp_path / "tiles.mbtiles"))
+    fetcher.set_tile_cache(None)
+
+    assert fetcher.get_tile_cache() is None
+    assert fetcher.fetch_tile_bytes(10, 20, 12)
+    assert fetcher.get_tile_cache() is None
+    assert not (tmp_path / "tiles.mbtiles").exists()
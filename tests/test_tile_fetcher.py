@@ -0,0 +1,104 @@
+import io
+import threading
+import time
+import pytest
+import requests
+from PIL import Image
+import config
+
+
+def _tile_bytes(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (256, 256), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class _Response:
+    def __init__(self, status, content=b""):
+        self.status_code = status
+        self.content = content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+
+class StubSession:
+    """Answers GETs from a function of the request number and URL."""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        with self._lock:
+            self.calls.append(url)
+            attempt = sum(call == url for call in self.calls)
+        return self.respond(url, attempt, timeout)
+
+
+@pytest.fixture
+def stub_fetcher(fetcher, monkeypatch):
+    monkeypatch.setattr(config, "TILE_URL", "stub://{z}/{x}/{y}")
+    monkeypatch.setattr(config, "TILE_FETCH_RETRIES", 2)
+    monkeypatch.setattr(config, "TILE_FETCH_BACKOFF", 0.01)
+    fetcher.set_tile_cache(None)
+
+    def install(respond):
+        session = StubSession(respond)
+        monkeypatch.setattr(fetcher, "get_session", lambda: session)
+        return session
+    return install
+
+
+def test_transient_errors_are_retried(stub_fetcher, fetcher):
+    def respond(url, attempt, timeout):
+        if attempt == 1:
+            raise requests.ConnectionError("reset")
+        if attempt == 2:
+            return _Response(503)
+        return _Response(200, _tile_bytes((200, 0, 0)))
+
+    session = stub_fetcher(respond)
+    assert fetcher.fetch_tile_bytes(1, 2, 3) == _tile_bytes((200, 0, 0))
+    assert session.calls == ["stub://3/1/2"] * 3
+
+
+def test_client_errors_are_not_retried(stub_fetcher, fetcher):
+    session = stub_fetcher(lambda url, attempt, timeout: _Response(404))
+    with pytest.raises(requests.HTTPError):
+        fetcher.fetch_tile_bytes(1, 2, 3)
+    assert len(session.calls) == 1
+
+
+def test_tiles_that_exhaust_their_retries_are_reported(stub_fetcher, fetcher):
+    def respond(url, attempt, timeout):
+        if url == "stub://5/11/20":
+            raise requests.ConnectionError("down")
+        return _Response(200, _tile_bytes((0, 0, 200)))
+
+    session = stub_fetcher(respond)
+    failed = set()
+    grid = fetcher.fetch_tile_grid(10, 20, 2, 1, 5, failed=failed)
+
+    assert failed == {(11, 20)}
+    assert session.calls.count("stub://5/11/20") == config.TILE_FETCH_RETRIES + 1
+    assert grid.getpixel((10, 10)) == (0, 0, 200)
+    assert grid.getpixel((300, 10)) == (0, 0, 0)  # left black
+
+
+def test_deadline_cuts_off_slow_tiles(stub_fetcher, fetcher):
+    def respond(url, attempt, timeout):
+        if url.endswith("/0"):
+            time.sleep(min(timeout, 1.0))
+            raise requests.Timeout("slow")
+        return _Response(200, _tile_bytes((0, 200, 0)))
+
+    stub_fetcher(respond)
+    failed = set()
+    start = time.monotonic()
+    fetcher.fetch_tile_grid(0, 0, 2, 2, 5, deadline=0.3, failed=failed)
+
+    assert time.monotonic() - start < 0.9
+    assert failed == {(0, 0), (1, 0)}
@@ -0,0 +1,52 @@
+import numpy as np
+from PIL import Image
+from config import UNLABELED
+from utils.tiling import blend_weights, blend_windows, window_origins
+
+
+def _one_hot(mask, num_classes):
+    return np.stack([mask == class_idx for class_idx in range(num_classes)]).astype(np.float32)
+
+
+def test_windows_cover_the_region_and_end_flush():
+    assert window_origins(100, 128, 96) == [0]
+    assert window_origins(300, 128, 96) == [0, 96, 172]
+
+
+def test_blend_weights_ramp_at_the_edges():
+    weights = blend_weights(8, 2)
+    assert weights[4, 4] == 1
+    assert weights[0, 4] < weights[1, 4] < weights[2, 4]
+    np.testing.assert_allclose(weights, weights.T)
+
+
+def test_blend_windows_reproduces_a_consistent_mask():
+    num_classes = 3
+    expected = np.random.default_rng(1).integers(0, num_classes, (150, 190), dtype=np.uint8)
+    source = Image.fromarray(expected)
+    out = np.zeros_like(expected)
+    finished = []
+
+    blend_windows(
+        out,
+        lambda y, x, h, w: source.crop((x, y, x + w, y + h)),
+        lambda image: _one_hot(np.asarray(image), num_classes),
+        num_classes, window=64, overlap=16,
+        on_rows=lambda y, rows: finished.append((y, rows.shape[0]))
+    )
+
+    np.testing.assert_array_equal(out, expected)
+    # Every row is handed to on_rows exactly once, top to bottom
+    assert [y for y, _ in finished] == sorted(y for y, _ in finished)
+    assert sum(count for _, count in finished) == expected.shape[0]
+
+
+def test_pixels_without_votes_are_unlabeled():
+    out = np.zeros((40, 40), dtype=np.uint8)
+    blend_windows(
+        out,
+        lambda y, x, h, w: Image.new("L", (w, h)),
+        lambda image: np.zeros((2, image.height, image.width), dtype=np.float32),
+        2, window=32, overlap=8
+    )
+    assert (out == UNLABELED).all()
@@ -0,0 +1,58 @@
+import json
+import numpy as np
+import pytest
+from PIL import Image
+import config
+from utils import wire
+from utils.wire import fit_size, rle_decode, rle_encode
+
+
+@pytest.mark.parametrize("mask", [
+    np.zeros((0, 5), dtype=np.uint8),
+    np.full((3, 4), 255, dtype=np.uint8),
+    np.array([[0, 0, 1], [1, 1, 255]], dtype=np.uint8),
+    np.random.default_rng(0).integers(0, 6, (64, 48), dtype=np.uint8),
+])
+def test_rle_round_trip(mask):
+    rle = rle_encode(mask)
+    assert sum(rle["lengths"]) == mask.size
+    np.testing.assert_array_equal(rle_decode(json.loads(json.dumps(rle))), mask)
+
+
+def test_rle_runs_continue_across_rows():
+    rle = rle_encode(np.array([[2, 2], [2, 5]], dtype=np.uint8))
+    assert rle == {"shape": [2, 2], "values": [2, 5], "lengths": [3, 1]}
+
+
+def test_fit_size_only_shrinks():
+    assert fit_size((4000, 1000), 1024) == (1024, 256)
+    assert fit_size((800, 600), 1024) == (800, 600)
+    assert fit_size((800, 600), None) == (800, 600)
+
+
+@pytest.mark.parametrize("fmt", ["png", "npz", "rle"])
+def test_mask_file_keeps_full_resolution(tmp_path, monkeypatch, fmt):
+    monkeypatch.setattr(wire, "DISPLAY_DIR", str(tmp_path))
+    mask = np.random.default_rng(1).integers(0, 6, (70, 90), dtype=np.uint8)
+    mask[:5] = config.UNLABELED
+
+    path = wire.mask_file(mask, fmt)
+    if fmt == "png":
+        with Image.open(path) as image:
+            loaded = np.asarray(image)
+    elif fmt == "npz":
+        with np.load(path) as data:
+            loaded = data["mask"]
+    else:
+        with open(path) as f:
+            loaded = rle_decode(json.load(f))
+    np.testing.assert_array_equal(loaded, mask)
+
+
+def test_unlabeled_pixels_have_their_own_color_in_png_downloads(tmp_path, monkeypatch):
+    monkeypatch.setattr(wire, "DISPLAY_DIR", str(tmp_path))
+    mask = np.array([[config.CLASSES.index("Road"), config.UNLABELED]], dtype=np.uint8)
+    with Image.open(wire.mask_file(mask, "png")) as image:
+        road, unlabeled = image.convert("RGB").getpixel((0, 0)), image.convert("RGB").getpixel((1, 0))
+    assert road == config.CLASS_COLORS["Road"]
+    assert unlabeled == config.UNLABELED_COLOR != road
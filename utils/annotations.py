@@ -0,0 +1,49 @@
+# annotations.py
+
+import numpy as np
+from skimage.measure import label as label_components
+from config import UNLABELED
+
+
+def label_regions(mask, min_area=1, max_per_class=None, output_size=None):
+    """
+    Connected regions of every class in one labelling pass over a multi-class mask.
+    Returns (class_idx, x, y, area) per kept region, with area in mask pixels and
+    the centroid scaled to output_size=(w, h) when given. Regions smaller than
+    min_area are dropped and at most max_per_class of the largest are kept per class.
+    """
+    height, width = mask.shape
+    labels = label_components(mask, background=UNLABELED, connectivity=1)
+    num_regions = labels.max()
+    if num_regions == 0:
+        return []
+
+    flat = labels.ravel()
+    area = np.bincount(flat, minlength=num_regions + 1)
+    rows, cols = np.divmod(np.arange(flat.size), width)
+    sum_y = np.bincount(flat, weights=rows, minlength=num_regions + 1)
+    sum_x = np.bincount(flat, weights=cols, minlength=num_regions + 1)
+    region_class = np.zeros(num_regions + 1, dtype=np.uint8)
+    region_class[flat] = mask.ravel()
+
+    ids = np.arange(1, num_regions + 1)
+    ids = ids[area[ids] >= min_area]
+    if len(ids) == 0:
+        return []
+
+    # Largest regions first within each class
+    ids = ids[np.lexsort((-area[ids], region_class[ids]))]
+    if max_per_class is not None:
+        classes = region_class[ids]
+        first = np.searchsorted(classes, classes, side="left")
+        ids = ids[np.arange(len(ids)) - first < max_per_class]
+
+    scale_x = output_size[0] / width if output_size else 1.0
+    scale_y = output_size[1] / height if output_size else 1.0
+    center_x = (sum_x[ids] / area[ids] + 0.5) * scale_x
+    center_y = (sum_y[ids] / area[ids] + 0.5) * scale_y
+
+    return [
+        (int(region_class[i]), int(x), int(y), int(area[i]))
+        for i, x, y in zip(ids, center_x, center_y)
+    ]
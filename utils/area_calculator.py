@@ -1,6 +1,81 @@
 #area_calculator.py
+import math
 import numpy as np
 from config import CLASSES
 
-def calculate_area(mask):
-    return {cls: int(np.sum(mask == idx)) for idx, cls in enumerate(CLASSES)}
+EARTH_RADIUS = 6378137.0  # Web Mercator sphere radius in metres
+TILE_SIZE = 256
+ROW_CHUNK = 256  # rows per bincount pass when computing per-row ground areas
+
+def class_histogram(mask):
+    """Pixel count per class in a single pass; ids outside CLASSES are ignored."""
+    counts = np.bincount(mask.ravel(), minlength=len(CLASSES))
+    return counts[:len(CLASSES)]
+
+def ground_resolution(lat, zoom):
+    """Metres per pixel at latitude lat (degrees, scalar or array) for Web Mercator tiles at zoom."""
+    return 2 * math.pi * EARTH_RADIUS * np.cos(np.radians(lat)) / (TILE_SIZE * 2 ** zoom)
+
+def row_pixel_areas(pixel_y0, rows, zoom):
+    """Ground area in m² of one pixel for each of rows rows starting at global pixel row pixel_y0."""
+    world = TILE_SIZE * 2 ** zoom
+    y = pixel_y0 + np.arange(rows, dtype=np.float64) + 0.5
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y / world))))
+    return ground_resolution(lat, zoom) ** 2
+
+def class_ground_area(mask, zoom, pixel_y0=0):
+    """Area in m² per class, weighting every row by its own latitude-dependent pixel area."""
+    num_classes = len(CLASSES)
+    areas = np.zeros(num_classes, dtype=np.float64)
+    for start in range(0, mask.shape[0], ROW_CHUNK):
+        chunk = mask[start:start + ROW_CHUNK]
+        rows = chunk.shape[0]
+        # one bincount over (row, class) pairs gives the per-row histogram of the chunk
+        keys = np.minimum(chunk, num_classes).astype(np.intp)
+        keys += (np.arange(rows, dtype=np.intp) * (num_classes + 1))[:, None]
+        per_row = np.bincount(keys.ravel(), minlength=rows * (num_classes + 1))
+        per_row = per_row.reshape(rows, num_classes + 1)[:, :num_classes]
+        areas += row_pixel_areas(pixel_y0 + start, rows, zoom) @ per_row
+    return areas
+
+class AreaAccumulator:
+    """
+    Accumulates class statistics over mask pieces (e.g. finished rows of a
+    streamed region) so the full mask never has to be held at once.
+    Pieces must not overlap; pixel_y0 is the global pixel row of mask row 0.
+    """
+
+    def __init__(self, zoom=None, pixel_y0=0):
+        self.zoom = zoom
+        self.pixel_y0 = pixel_y0
+        self.pixels = np.zeros(len(CLASSES), dtype=np.int64)
+        self.area_m2 = np.zeros(len(CLASSES), dtype=np.float64)
+
+    def add(self, mask, row_offset=0):
+        self.pixels += class_histogram(mask)
+        if self.zoom is not None:
+            self.area_m2 += class_ground_area(mask, self.zoom, self.pixel_y0 + row_offset)
+
+    def result(self):
+        return {
+            cls: {
+                "pixels": int(self.pixels[idx]),
+                "area_m2": None if self.zoom is None else round(float(self.area_m2[idx]), 2)
+            }
+            for idx, cls in enumerate(CLASSES)
+        }
+
+def calculate_area(mask, zoom=None, pixel_y0=0):
+    """
+    {class: {"pixels", "area_m2"}} for a mask. area_m2 is None unless the
+    zoom (and global pixel row of the mask's first row) is known.
+    """
+    accumulator = AreaAccumulator(zoom, pixel_y0)
+    accumulator.add(mask)
+    return accumulator.result()
+
+def add_ground_area(areas, mask, zoom, pixel_y0=0):
+    """Fill in area_m2 of a calculate_area() result computed before the zoom was known."""
+    for cls, area_m2 in zip(CLASSES, class_ground_area(mask, zoom, pixel_y0)):
+        areas[cls]["area_m2"] = round(float(area_m2), 2)
+    return areas
@@ -0,0 +1,104 @@
+# backends.py
+
+import os
+import numpy as np
+import config
+
+# Inference backends each predictor can run on; the first one is the reference
+BACKENDS = {
+    "YOLOv11": ["pytorch", "torchscript", "onnx", "onnx-int8"],
+    "UNet": ["keras", "tflite", "tflite-int8"],
+    "MaskRCNN": ["detectron2", "detectron2-int8"],
+}
+
+# Exported artifact next to the original weights, by backend
+_ARTIFACT_SUFFIXES = {
+    "torchscript": ".torchscript",
+    "onnx": ".onnx",
+    "onnx-int8": "_int8.onnx",
+    "tflite": ".tflite",
+    "tflite-int8": "_int8.tflite",
+}
+
+
+def artifact_path(weights_path, backend):
+    """Path of the exported model for backend (the original weights for in-process backends)."""
+    suffix = _ARTIFACT_SUFFIXES.get(backend)
+    if suffix is None:
+        return weights_path
+    return os.path.splitext(weights_path)[0] + suffix
+
+
+def check_backend(model_type, backend):
+    if backend not in BACKENDS[model_type]:
+        raise ValueError(f"Unknown backend {backend!r} for {model_type}, expected one of {BACKENDS[model_type]}")
+
+
+def configure_torch_threads():
+    """Apply config.CPU_INTRA_OP_THREADS / CPU_INTER_OP_THREADS to PyTorch."""
+    import torch
+    if config.CPU_INTRA_OP_THREADS:
+        torch.set_num_threads(config.CPU_INTRA_OP_THREADS)
+    if config.CPU_INTER_OP_THREADS:
+        try:
+            torch.set_num_interop_threads(config.CPU_INTER_OP_THREADS)
+        except RuntimeError:
+            pass  # can only be set once, before any inter-op parallel work
+
+
+def configure_tf_threads():
+    """Apply config.CPU_INTRA_OP_THREADS / CPU_INTER_OP_THREADS to TensorFlow."""
+    import tensorflow as tf
+    try:
+        if config.CPU_INTRA_OP_THREADS:
+            tf.config.threading.set_intra_op_parallelism_threads(config.CPU_INTRA_OP_THREADS)
+        if config.CPU_INTER_OP_THREADS:
+            tf.config.threading.set_inter_op_parallelism_threads(config.CPU_INTER_OP_THREADS)
+    except RuntimeError:
+        pass  # must be set before TensorFlow is initialized
+
+
+class TFLiteModel:
+    """
+    TFLite interpreter with the subset of the Keras model API UnetPredictor
+    uses (predict on a float batch). Quantized models get their inputs
+    and outputs (de)quantized here.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        import tensorflow as tf
+        self.interpreter = tf.lite.Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+
+    def _quantize(self, array, details):
+        scale, zero_point = details["quantization"]
+        if details["dtype"] == np.float32 or not scale:
+            return array.astype(details["dtype"])
+        return np.clip(np.round(array / scale + zero_point), np.iinfo(details["dtype"]).min,
+                       np.iinfo(details["dtype"]).max).astype(details["dtype"])
+
+    def _dequantize(self, array, details):
+        scale, zero_point = details["quantization"]
+        if details["dtype"] == np.float32 or not scale:
+            return array.astype(np.float32)
+        return (array.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch, batch_size=None, verbose=None):
+        batch = np.asarray(batch, dtype=np.float32)
+        if tuple(self.input["shape"]) != batch.shape:
+            self.interpreter.resize_tensor_input(self.input["index"], batch.shape)
+            self.interpreter.allocate_tensors()
+            self.input = self.interpreter.get_input_details()[0]
+            self.output = self.interpreter.get_output_details()[0]
+
+        self.interpreter.set_tensor(self.input["index"], self._quantize(batch, self.input))
+        self.interpreter.invoke()
+        return self._dequantize(self.interpreter.get_tensor(self.output["index"]), self.output)
+
+
+def quantize_torch_dynamic(module):
+    """int8 dynamic quantization of a PyTorch module's Linear layers."""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
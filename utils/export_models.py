@@ -0,0 +1,118 @@
+# export_models.py
+"""
+Export the trained weights in models/ to optimized CPU artifacts.
+
+    python -m utils.export_models                          # everything exportable
+    python -m utils.export_models --models UNet --backends tflite-int8
+
+Artifacts are written next to the original weights (see backends.artifact_path)
+and selected at runtime through config.MODEL_BACKENDS. Mask R-CNN has nothing
+to export: its int8 backend quantizes the loaded model's Linear layers.
+"""
+
+import argparse
+import glob
+import os
+import numpy as np
+from PIL import Image
+import config
+from utils.backends import BACKENDS, artifact_path
+from utils.models import weights_path
+
+CALIBRATION_IMAGES = os.path.join("assets", "test_images", "*.jpg")
+
+
+def export_yolo(backends):
+    from ultralytics import YOLO
+
+    weights = weights_path("YOLOv11")
+    model = YOLO(weights)
+    exported = []
+
+    # Ultralytics writes <weights>.torchscript / <weights>.onnx, matching artifact_path
+    if "torchscript" in backends:
+        exported.append(model.export(format="torchscript", imgsz=512))
+
+    if "onnx" in backends or "onnx-int8" in backends:
+        # Dynamic axes, so predict_batch can run a whole micro-batch in one session call
+        onnx_path = model.export(format="onnx", imgsz=512, simplify=True, dynamic=True)
+        exported.append(onnx_path)
+
+        if "onnx-int8" in backends:
+            import onnx
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            int8_path = artifact_path(weights, "onnx-int8")
+            quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+
+            # Ultralytics reads class names and strides from the ONNX metadata
+            source, target = onnx.load(onnx_path), onnx.load(int8_path)
+            del target.metadata_props[:]
+            target.metadata_props.extend(source.metadata_props)
+            onnx.save(target, int8_path)
+            exported.append(int8_path)
+
+    return exported
+
+
+def _calibration_batches(input_size=(256, 256), crops_per_image=8, seed=0):
+    """UNet-preprocessed random crops of the bundled test images for int8 calibration."""
+    rng = np.random.default_rng(seed)
+    for path in sorted(glob.glob(CALIBRATION_IMAGES)):
+        image = Image.open(path).convert("RGB")
+        for _ in range(crops_per_image):
+            side = int(rng.integers(min(image.size) // 3, min(image.size) + 1))
+            x = int(rng.integers(0, image.size[0] - side + 1))
+            y = int(rng.integers(0, image.size[1] - side + 1))
+            crop = image.crop((x, y, x + side, y + side)).resize(input_size)
+            yield [np.expand_dims(np.asarray(crop, dtype=np.float32) / 255.0, axis=0)]
+
+
+def export_unet(backends):
+    import tensorflow as tf
+
+    weights = weights_path("UNet")
+    model = tf.keras.models.load_model(weights, compile=False)
+    exported = []
+
+    for backend in ("tflite", "tflite-int8"):
+        if backend not in backends:
+            continue
+        converter = tf.lite.TFLiteConverter.from_keras_model(model)
+        if backend == "tflite-int8":
+            # Static int8: weights and activations, float input/output kept for the predictor
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = _calibration_batches
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+        path = artifact_path(weights, backend)
+        with open(path, "wb") as f:
+            f.write(converter.convert())
+        exported.append(path)
+    return exported
+
+
+EXPORTERS = {"YOLOv11": export_yolo, "UNet": export_unet}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export models to optimized CPU backends.")
+    parser.add_argument("--models", nargs="+", default=list(EXPORTERS), choices=list(BACKENDS))
+    parser.add_argument("--backends", nargs="+", default=None,
+                        help="backends to export (default: every exported backend of each model)")
+    args = parser.parse_args(argv)
+
+    for name in args.models:
+        if name not in EXPORTERS:
+            print(f"{name}: nothing to export, its optimized backend is applied at load time.")
+            continue
+        backends = [b for b in BACKENDS[name][1:] if args.backends is None or b in args.backends]
+        if not backends:
+            continue
+        for path in EXPORTERS[name](backends):
+            print(f"{name}: wrote {path}")
+        print(f"Select with config.MODEL_BACKENDS[{name!r}] (currently {config.MODEL_BACKENDS.get(name)!r}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,95 @@
 # image_processing.py
+from collections.abc import Sequence
+from functools import lru_cache
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 import requests
 from io import BytesIO
 from config import CLASS_COLORS, CLASSES
+from utils.rendering import colorize
+from utils.area_calculator import class_histogram
+
+TITLE_HEIGHT = 50
 
 def overlay_mask_on_image(image, mask):
     """Overlay segmentation mask with color on the original image."""
-    image_np = np.array(image).copy()
-    for idx, cls in enumerate(CLASSES):
-        color = CLASS_COLORS[cls]
-        image_np[mask == idx] = color
-    return Image.fromarray(image_np)
-
-def split_by_class(mask):
-    """Generate per-class segmentation images with labels and pixel info."""
-    labeled_images = []
-    if mask is None or len(mask.shape) < 2:
-        return labeled_images
-        
-    width, height = mask.shape[1], mask.shape[0]
-    title_height = 50
-    total_pixels = width * height
+    color_np = colorize(mask)
+    unknown = mask >= len(CLASSES)
+    if unknown.any():
+        color_np[unknown] = np.asarray(image)[unknown]
+    return Image.fromarray(color_np)
 
+@lru_cache(maxsize=8)
+def get_font(size=30):
+    """Load the banner font once per size."""
     try:
-        font = ImageFont.truetype("arial.ttf", 30)
-    except:
-        font = ImageFont.load_default()
+        return ImageFont.truetype("arial.ttf", size)
+    except OSError:
+        return ImageFont.load_default()
+
+class ClassImages(Sequence):
+    """
+    Per-class segmentation images rendered on first access and then cached.
+    Only classes present in the mask are included. Each image is a "P"-mode
+    image (white banner, black background, class color) or, with mode="1",
+    a 1-bit image; max_size downsizes the mask before rendering thumbnails.
+    """
+
+    def __init__(self, mask, max_size=None, mode="P"):
+        self.counts = class_histogram(mask)
+        self.total_pixels = mask.shape[0] * mask.shape[1]
+        self.class_ids = [idx for idx in range(len(CLASSES)) if self.counts[idx] > 0]
+        self.mode = mode
+        self.font_size = 30
 
-    for idx, class_name in enumerate(CLASSES):
-        binary_mask = (mask == idx).astype(np.uint8) * 255
-        pixel_count = int(np.sum(mask == idx))
-        percent = (pixel_count / total_pixels) * 100 if total_pixels > 0 else 0
+        if max_size is not None and max(mask.shape) > max_size:
+            scale = max_size / max(mask.shape)
+            size = (max(int(mask.shape[1] * scale), 1), max(int(mask.shape[0] * scale), 1))
+            mask = np.array(Image.fromarray(mask).resize(size, Image.NEAREST))
+            self.font_size = max(12, min(30, size[0] // 25))
+        self.mask = mask
+        self._images = {}
 
-        # Create tinted image for class
-        tint = np.zeros((height, width, 3), dtype=np.uint8)
-        tint[binary_mask == 255] = CLASS_COLORS[class_name]
-        class_img = Image.fromarray(tint)
+    def __len__(self):
+        return len(self.class_ids)
 
-        # Add label banner
-        labeled_img = Image.new("RGB", (width, height + title_height), (255, 255, 255))
-        labeled_img.paste(class_img, (0, title_height))
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        idx = self.class_ids[index]
+        image = self._images.get(idx)
+        if image is None:
+            image = self._images[idx] = self._render(idx)
+        return image
 
+    def _render(self, idx):
+        class_name = CLASSES[idx]
+        height, width = self.mask.shape
+        pixel_count = int(self.counts[idx])
+        percent = (pixel_count / self.total_pixels) * 100 if self.total_pixels > 0 else 0
+
+        # Palette index 0 = white banner, 1 = black, 2 = class color
+        canvas = np.zeros((height + TITLE_HEIGHT, width), dtype=np.uint8)
+        canvas[TITLE_HEIGHT:] = 1
+        canvas[TITLE_HEIGHT:][self.mask == idx] = 2
+        labeled_img = Image.fromarray(canvas, mode="P")
+        labeled_img.putpalette([255, 255, 255, 0, 0, 0, *CLASS_COLORS[class_name]])
+
+        font = get_font(self.font_size)
         label_text = f"{class_name} - {pixel_count} px ({percent:.2f}%)"
         draw = ImageDraw.Draw(labeled_img)
         bbox = draw.textbbox((0, 0), label_text, font=font)
         text_x = (width - (bbox[2] - bbox[0])) // 2
-        draw.text((text_x, (title_height - (bbox[3] - bbox[1])) // 2), 
-                 label_text, fill=(0, 0, 0), font=font)
+        draw.text((text_x, (TITLE_HEIGHT - (bbox[3] - bbox[1])) // 2),
+                 label_text, fill=1, font=font)
 
-        labeled_images.append(labeled_img)
-
-    return labeled_images
+        if self.mode == "1":
+            # White wherever the palette index isn't black (banner and class), from the indices themselves
+            return Image.fromarray(np.asarray(labeled_img) != 1).convert("1")
+        return labeled_img
 
+def split_by_class(mask, max_size=None, mode="P"):
+    """Generate per-class segmentation images with labels and pixel info (rendered lazily)."""
+    if mask is None or len(mask.shape) < 2:
+        return []
+    return ClassImages(mask, max_size=max_size, mode=mode)
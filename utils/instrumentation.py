@@ -0,0 +1,190 @@
+# instrumentation.py
+
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+import config
+
+logger = logging.getLogger("satseg.profile")
+
+_current = contextvars.ContextVar("satseg_profile", default=None)
+
+# Process-wide counters for Prometheus-style export: stage -> [calls, wall, cpu, bytes]
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+class _NullStage:
+    """Shared no-op stage used when no profile is active."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ("profile", "name", "wall", "cpu", "bytes", "_parent")
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+        self.bytes = 0
+
+    def __enter__(self):
+        self._parent = self.profile._stage
+        if self._parent is not None:
+            self.name = f"{self._parent.name}/{self.name}"
+        self.profile._stage = self
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.thread_time() - self.cpu
+        self.profile._stage = self._parent
+        self.profile.stages.append({
+            "stage": self.name,
+            "wall_s": round(wall, 6),
+            "cpu_s": round(cpu, 6),
+            "bytes": self.bytes,
+            **({"error": exc_type.__name__} if exc_type is not None else {})
+        })
+        return False
+
+
+class RequestProfile:
+    """Per-stage wall time, thread CPU time and array bytes collected for one request."""
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = []
+        self.backend = None
+        self._stage = None
+        self._start = time.perf_counter()
+
+    def merge(self, other):
+        """Append the stages of another profile's to_dict() (e.g. from a worker thread)."""
+        if other:
+            # merged stages were already counted by the profile that recorded them
+            self.stages.extend(dict(entry, merged=True) for entry in other.get("stages", []))
+            self.backend = self.backend or other.get("backend")
+
+    def to_dict(self):
+        """Stages aggregated by name, in first-seen order, with a call count each."""
+        aggregated = {}
+        for entry in self.stages:
+            total = aggregated.get(entry["stage"])
+            if total is None:
+                aggregated[entry["stage"]] = dict(entry, calls=entry.get("calls", 1))
+                continue
+            total["calls"] += entry.get("calls", 1)
+            total["wall_s"] = round(total["wall_s"] + entry["wall_s"], 6)
+            total["cpu_s"] = round(total["cpu_s"] + entry["cpu_s"], 6)
+            total["bytes"] += entry["bytes"]
+            if "error" in entry:
+                total["error"] = entry["error"]
+        for total in aggregated.values():
+            total.pop("merged", None)
+        return {
+            "request": self.name,
+            "backend": self.backend,
+            "total_wall_s": round(time.perf_counter() - self._start, 6),
+            "stages": list(aggregated.values())
+        }
+
+
+def current_profile():
+    return _current.get()
+
+
+@contextmanager
+def profile_request(name):
+    """
+    Collect stages for one request, yielding the RequestProfile (or None when
+    profiling is disabled). Nested calls reuse the already active profile.
+    """
+    if not config.PROFILING_ENABLED:
+        yield None
+        return
+
+    active = _current.get()
+    if active is not None:
+        yield active
+        return
+
+    profile = RequestProfile(name)
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        _export(profile)
+
+
+def stage(name):
+    """Time a block as a stage of the active profile; a shared no-op when none is active."""
+    profile = _current.get()
+    if profile is None:
+        return _NULL_STAGE
+    return _Stage(profile, name)
+
+
+def record_bytes(*arrays):
+    """Add the size of numpy arrays or PIL images to the innermost active stage."""
+    profile = _current.get()
+    if profile is None or profile._stage is None:
+        return
+    for array in arrays:
+        nbytes = getattr(array, "nbytes", None)
+        if nbytes is None and hasattr(array, "size") and hasattr(array, "getbands"):
+            nbytes = array.size[0] * array.size[1] * len(array.getbands())
+        profile._stage.bytes += nbytes or 0
+
+
+def set_backend(backend):
+    profile = _current.get()
+    if profile is not None:
+        profile.backend = backend
+
+
+def _export(profile):
+    with _counters_lock:
+        for entry in profile.stages:
+            if entry.get("merged"):
+                continue
+            counter = _counters.setdefault(entry["stage"], [0, 0.0, 0.0, 0])
+            counter[0] += entry.get("calls", 1)
+            counter[1] += entry["wall_s"]
+            counter[2] += entry["cpu_s"]
+            counter[3] += entry["bytes"]
+    if config.PROFILING_LOG:
+        logger.info(json.dumps(profile.to_dict()))
+
+
+def prometheus_text():
+    """Accumulated stage counters in the Prometheus text exposition format."""
+    metrics = [
+        ("satseg_stage_calls_total", "Number of times a stage ran", 0),
+        ("satseg_stage_wall_seconds_total", "Wall-clock seconds spent in a stage", 1),
+        ("satseg_stage_cpu_seconds_total", "Thread CPU seconds spent in a stage", 2),
+        ("satseg_stage_bytes_total", "Array bytes allocated in a stage", 3),
+    ]
+    with _counters_lock:
+        counters = {name: list(values) for name, values in _counters.items()}
+
+    lines = []
+    for metric, help_text, index in metrics:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, values in sorted(counters.items()):
+            lines.append(f'{metric}{{stage="{name}"}} {values[index]}')
+    return "\n".join(lines) + "\n"
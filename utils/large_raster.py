@@ -0,0 +1,252 @@
+# large_raster.py
+"""
+Windowed access to local rasters too large to load at once, and a Deep Zoom
+(DZI) writer for their overlays.
+
+    python -m utils.large_raster ortho.tif --model UNet --output out/
+
+Uncompressed TIFF/GeoTIFF and .npy inputs are memory-mapped; tiled or
+stripped compressed TIFFs decode only the segments a window touches. Other
+formats fall back to PIL and are loaded whole.
+"""
+
+import abc
+import argparse
+import json
+import math
+import os
+import numpy as np
+from PIL import Image
+from utils.rendering import blend_overlay
+
+PYRAMID_TILE_SIZE = 256
+
+
+def _to_rgb(array):
+    """(h, w[, c]) raster data of any integer dtype as (h, w, 3) uint8."""
+    if array.ndim == 2:
+        array = array[:, :, None]
+    if array.shape[2] == 1:
+        array = np.repeat(array, 3, axis=2)
+    array = array[:, :, :3]
+    if array.dtype == np.uint16:
+        array = array >> 8
+    return np.asarray(array, dtype=np.uint8)
+
+
+class RasterReader(abc.ABC):
+    """
+    Reads (h, w, 3) uint8 windows of a raster. Use open_raster() to construct;
+    close() releases the underlying file.
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @abc.abstractmethod
+    def read(self, y, x, h, w):
+        """(h, w, 3) uint8 window with top-left corner (y, x)."""
+
+    def read_image(self, y, x, h, w):
+        return Image.fromarray(self.read(y, x, h, w))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ArrayReader(RasterReader):
+    """Windows sliced from an (H, W[, C]) array, typically a np.memmap."""
+
+    def __init__(self, array, handle=None):
+        super().__init__(array.shape[1], array.shape[0])
+        self.array = array
+        self._handle = handle
+
+    def read(self, y, x, h, w):
+        return _to_rgb(np.asarray(self.array[y:y + h, x:x + w]))
+
+    def close(self):
+        self.array = None
+        if self._handle is not None:
+            self._handle.close()
+
+
+class TiffSegmentReader(RasterReader):
+    """Windows assembled from only the tiles/strips of a compressed TIFF they intersect."""
+
+    def __init__(self, tif):
+        page = tif.pages[0]
+        if page.planarconfig != 1 or page.imagedepth != 1:
+            raise ValueError("only contiguous-plane 2D TIFFs can be read in windows")
+        super().__init__(page.imagewidth, page.imagelength)
+        self._tif = tif
+        self._page = page
+        if page.is_tiled:
+            self._segment = (page.tilelength, page.tilewidth)
+        else:
+            self._segment = (min(page.rowsperstrip, page.imagelength), page.imagewidth)
+        self._across = math.ceil(self.width / self._segment[1])
+
+    def read(self, y, x, h, w):
+        seg_h, seg_w = self._segment
+        page = self._page
+        indices = [
+            row * self._across + col
+            for row in range(y // seg_h, (y + h - 1) // seg_h + 1)
+            for col in range(x // seg_w, (x + w - 1) // seg_w + 1)
+        ]
+        out = None
+        segments = self._tif.filehandle.read_segments(
+            [page.dataoffsets[i] for i in indices],
+            [page.databytecounts[i] for i in indices],
+            indices=indices
+        )
+        for data, index in segments:
+            segment, (_, _, sy, sx, _), _ = page.decode(data, index, jpegtables=page.jpegtables)
+            segment = _to_rgb(segment[0])
+            if out is None:
+                out = np.zeros((h, w, 3), dtype=np.uint8)
+            # intersect the decoded segment (which may be padded past the image edge) with the window
+            y0, y1 = max(sy, y), min(sy + segment.shape[0], y + h, self.height)
+            x0, x1 = max(sx, x), min(sx + segment.shape[1], x + w, self.width)
+            out[y0 - y:y1 - y, x0 - x:x1 - x] = segment[y0 - sy:y1 - sy, x0 - sx:x1 - sx]
+        return out if out is not None else np.zeros((h, w, 3), dtype=np.uint8)
+
+    def close(self):
+        self._tif.close()
+
+
+def open_raster(path):
+    """RasterReader for path, memory-mapping or segment-decoding whenever the format allows."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return ArrayReader(np.load(path, mmap_mode="r"))
+
+    if ext in (".tif", ".tiff"):
+        import tifffile
+
+        try:
+            return ArrayReader(tifffile.memmap(path, mode="r"))
+        except ValueError:
+            pass  # compressed or otherwise not contiguous on disk
+        tif = tifffile.TiffFile(path)
+        try:
+            return TiffSegmentReader(tif)
+        except ValueError:
+            tif.close()
+
+    # Large rasters are the point here; lift PIL's decompression-bomb limit for this open only
+    limit, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+    try:
+        with Image.open(path) as image:
+            return ArrayReader(np.asarray(image.convert("RGB")))
+    finally:
+        Image.MAX_IMAGE_PIXELS = limit
+
+
+class DeepZoomWriter:
+    """
+    Writes a Deep Zoom image pyramid (<name>.dzi + <name>_files/<level>/<col>_<row>.jpg).
+    Full-resolution tiles are added one tile row at a time with add_rows();
+    finish() then builds each lower level from the four child tiles of the
+    level above, so only a handful of tiles are ever in memory.
+    """
+
+    def __init__(self, directory, name, width, height, tile_size=PYRAMID_TILE_SIZE, quality=85):
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.quality = quality
+        self.dzi_path = os.path.join(directory, f"{name}.dzi")
+        self.tiles_dir = os.path.join(directory, f"{name}_files")
+        self.max_level = math.ceil(math.log2(max(width, height, 1)))
+
+    def level_size(self, level):
+        scale = 2 ** (self.max_level - level)
+        return max(math.ceil(self.width / scale), 1), max(math.ceil(self.height / scale), 1)
+
+    def _tile_path(self, level, col, row):
+        return os.path.join(self.tiles_dir, str(level), f"{col}_{row}.jpg")
+
+    def add_rows(self, y, image):
+        """Cut a full-resolution band starting at row y (a multiple of tile_size) into tiles."""
+        row = y // self.tile_size
+        os.makedirs(os.path.join(self.tiles_dir, str(self.max_level)), exist_ok=True)
+        for col in range(math.ceil(self.width / self.tile_size)):
+            left = col * self.tile_size
+            tile = image.crop((left, 0, min(left + self.tile_size, image.width), image.height))
+            tile.save(self._tile_path(self.max_level, col, row), quality=self.quality)
+
+    def finish(self):
+        size = self.tile_size
+        for level in range(self.max_level - 1, -1, -1):
+            width, height = self.level_size(level)
+            os.makedirs(os.path.join(self.tiles_dir, str(level)), exist_ok=True)
+            for row in range(math.ceil(height / size)):
+                for col in range(math.ceil(width / size)):
+                    canvas = Image.new("RGB", (2 * size, 2 * size))
+                    extent = [0, 0]
+                    for dy in (0, 1):
+                        for dx in (0, 1):
+                            child = self._tile_path(level + 1, 2 * col + dx, 2 * row + dy)
+                            if os.path.exists(child):
+                                with Image.open(child) as tile:
+                                    canvas.paste(tile, (dx * size, dy * size))
+                                    extent[0] = max(extent[0], dx * size + tile.width)
+                                    extent[1] = max(extent[1], dy * size + tile.height)
+                    tile = canvas.crop((0, 0, *extent)).resize(
+                        (max(extent[0] // 2, 1), max(extent[1] // 2, 1)), Image.BOX
+                    )
+                    tile.save(self._tile_path(level, col, row), quality=self.quality)
+
+        with open(self.dzi_path, "w") as f:
+            f.write(
+                '<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+                f'Format="jpg" Overlap="0" TileSize="{size}">\n'
+                f'  <Size Width="{self.width}" Height="{self.height}"/>\n'
+                '</Image>\n'
+            )
+        return self.dzi_path
+
+
+def write_overlay_pyramid(reader, mask, directory, name="overlay", alpha=0.5):
+    """Blend mask over the raster one tile row at a time into a Deep Zoom pyramid."""
+    writer = DeepZoomWriter(directory, name, reader.width, reader.height)
+    for y in range(0, reader.height, writer.tile_size):
+        h = min(writer.tile_size, reader.height - y)
+        band = reader.read_image(y, 0, h, reader.width)
+        writer.add_rows(y, blend_overlay(band, np.asarray(mask[y:y + h]), alpha))
+    return writer.finish()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segment a large local raster in windows.")
+    parser.add_argument("raster", help="TIFF/GeoTIFF, .npy or any PIL-readable image")
+    parser.add_argument("--model", default="UNet", choices=["YOLOv11", "UNet", "MaskRCNN"])
+    parser.add_argument("--output", default="raster_output")
+    parser.add_argument("--window", type=int, default=None)
+    parser.add_argument("--overlap", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    from utils.predictor import predict_raster
+
+    result = predict_raster(args.model, args.raster, args.output, args.window, args.overlap)
+    if "error" in result:
+        parser.exit(1, f"Error: {result['error']}\n")
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
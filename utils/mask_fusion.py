@@ -0,0 +1,92 @@
+# mask_fusion.py
+
+import numpy as np
+from PIL import Image
+from config import UNLABELED
+
+
+def fuse_dense(masks, classes, scores, threshold=0.5, background=UNLABELED):
+    """
+    Semantic mask from a dense (N, H, W) stack of instance masks.
+    Each pixel takes the class of the highest-scoring instance covering it
+    (one vectorized argmax); uncovered pixels get background.
+    """
+    if len(masks) == 0:
+        return np.full(masks.shape[1:], background, dtype=np.uint8)
+
+    scores = np.asarray(scores, dtype=np.float32)
+    weighted = np.where(masks > threshold, scores[:, None, None], np.float32(-1))
+    best = np.argmax(weighted, axis=0)
+    semantic_mask = np.asarray(classes, dtype=np.uint8)[best]
+    covered = np.take_along_axis(weighted, best[None], axis=0)[0] >= 0
+    semantic_mask[~covered] = background
+    return semantic_mask
+
+
+def fuse_boxes(mask_probs, boxes, classes, scores, shape, threshold=0.5, background=UNLABELED):
+    """
+    Semantic mask of size shape=(H, W) from low-resolution per-instance mask
+    probabilities (N, m, m) and their boxes (N, 4, x1 y1 x2 y2 in output pixels).
+    Each mask is resized to its own box and pasted in descending score order
+    into still-unclaimed pixels, so memory scales with box areas rather than N x H x W.
+    """
+    height, width = shape
+    semantic_mask = np.full((height, width), background, dtype=np.uint8)
+
+    for i in np.argsort(-np.asarray(scores), kind="stable"):
+        x1, y1, x2, y2 = boxes[i]
+        left, top = max(int(np.floor(x1)), 0), max(int(np.floor(y1)), 0)
+        right, bottom = min(int(np.ceil(x2)), width), min(int(np.ceil(y2)), height)
+        if right <= left or bottom <= top:
+            continue
+
+        # Resize the m x m probabilities to the full box, then crop to the visible part
+        box_w, box_h = max(int(round(x2 - x1)), 1), max(int(round(y2 - y1)), 1)
+        crop = Image.fromarray(np.asarray(mask_probs[i], dtype=np.float32), mode="F").resize(
+            (box_w, box_h), Image.BILINEAR
+        )
+        offset_x, offset_y = left - int(np.floor(x1)), top - int(np.floor(y1))
+        crop = np.asarray(crop)[offset_y:offset_y + bottom - top, offset_x:offset_x + right - left]
+
+        region = semantic_mask[top:top + crop.shape[0], left:left + crop.shape[1]]
+        region[(crop > threshold) & (region == background)] = classes[i]
+
+    return semantic_mask
+
+
+def fuse_votes(masks, weights=None, num_classes=None, background=UNLABELED):
+    """
+    Per-pixel weighted vote over semantic masks of equal shape (one per model).
+    Unlabeled pixels cast no vote; pixels no model labels get background.
+    Ties go to the class of the earliest mask with the largest weight.
+    """
+    if num_classes is None:
+        from config import CLASSES
+        num_classes = len(CLASSES)
+    weights = [1.0] * len(masks) if weights is None else weights
+    votes = np.zeros((num_classes,) + masks[0].shape, dtype=np.float32)
+    for rank, (mask, weight) in enumerate(zip(masks, weights)):
+        # a tiny rank bonus breaks ties in favour of earlier masks
+        weight = np.float32(weight * (1 + 1e-3 * (len(masks) - rank)))
+        for class_idx in range(num_classes):
+            votes[class_idx] += (mask == class_idx) * weight
+
+    fused = np.argmax(votes, axis=0).astype(np.uint8)
+    fused[votes.max(axis=0) <= 0] = background
+    return fused
+
+
+def pairwise_agreement(masks, background=UNLABELED):
+    """
+    Fraction of pixels on which each pair of named masks assigns the same
+    class, counting only pixels at least one of the two labels.
+    """
+    names = list(masks)
+    agreement = {}
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            labelled = (masks[a] != background) | (masks[b] != background)
+            total = int(labelled.sum())
+            same = int(((masks[a] == masks[b]) & labelled).sum())
+            agreement[f"{a}/{b}"] = round(same / total, 4) if total else 1.0
+    return agreement
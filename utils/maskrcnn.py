@@ -1,13 +1,21 @@
 import numpy as np
+import torch
 from PIL import Image, ImageDraw, ImageFont
+from utils.rendering import blend_overlay
+from utils.mask_fusion import fuse_boxes
+from utils.backends import check_backend, configure_torch_threads, quantize_torch_dynamic
+from utils.instrumentation import stage, record_bytes
 from detectron2.config import get_cfg
 from detectron2.engine import DefaultPredictor
 from detectron2 import model_zoo
 from detectron2.data import MetadataCatalog
 
 class MaskRCNNPredictor:
-    def __init__(self, model_path):
+    def __init__(self, model_path, backend="detectron2"):
+        check_backend("MaskRCNN", backend)
+        configure_torch_threads()
         self.model_path = model_path
+        self.backend = f"{backend}-torch"
 
         # Define class names and class colors (no longer from config.py)
         self.class_names = {
@@ -35,37 +43,103 @@ class MaskRCNNPredictor:
         cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = 0.5
         cfg.MODEL.DEVICE = "cpu"
         self.predictor = DefaultPredictor(cfg)
+        if backend == "detectron2-int8":
+            self.predictor.model = quantize_torch_dynamic(self.predictor.model)
 
-    def predict(self, image):
-        original_size = image.size
-        image_np = np.array(image.convert("RGB"))
-
-        outputs = self.predictor(image_np[:, :, ::-1])  # BGR for Detectron2
-        instances = outputs["instances"].to("cpu")
+    def _unpack(self, instances, size):
+        """
+        Fused semantic mask, classes and boxes (original image pixels) from the
+        un-postprocessed instances of one image. The low-resolution mask
+        probabilities are pasted into their boxes directly, so the N
+        full-resolution masks Detectron2 would paste are never materialised.
+        """
+        instances = instances.to("cpu")
 
         if not instances.has("pred_masks") or not instances.has("pred_classes"):
             raise ValueError("No masks or classes predicted by Mask R-CNN.")
 
-        masks = instances.pred_masks.numpy()  # (N, H, W)
+        width, height = size
+        resized_h, resized_w = instances.image_size
+        scale = np.array([width / resized_w, height / resized_h] * 2, dtype=np.float32)
+
+        mask_probs = instances.pred_masks[:, 0].numpy()  # (N, 28, 28)
         classes = instances.pred_classes.numpy().astype(np.uint8)  # (N,)
-        boxes = instances.pred_boxes.tensor.numpy()  # (N, 4)
+        scores = instances.scores.numpy()  # (N,)
+        boxes = instances.pred_boxes.tensor.numpy() * scale  # (N, 4)
 
-        h, w = image_np.shape[:2]
-        semantic_mask = np.zeros((h, w), dtype=np.uint8)
-        color_mask = np.zeros((h, w, 3), dtype=np.uint8)
+        semantic_mask = fuse_boxes(mask_probs, boxes, classes, scores, (height, width))
+        record_bytes(mask_probs, semantic_mask)
+        return semantic_mask, classes, boxes
 
-        for i in range(len(masks)):
-            mask = masks[i] > 0.5
-            cls_id = classes[i]
-            semantic_mask[mask] = cls_id
-            color_mask[mask] = self.class_colors.get(cls_id, (255, 255, 255))
+    def _infer(self, image):
+        """Run the model and return the fused semantic mask, classes and boxes."""
+        result = self._infer_batch([image])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _infer_batch(self, images):
+        """
+        Same as _infer for several images in one forward pass of the underlying model.
+        Returns the exception instead of a result for images that fail.
+        """
+        inputs = []
+        with stage("preprocess"):
+            for image in images:
+                image_bgr = np.array(image.convert("RGB"))[:, :, ::-1]  # BGR for Detectron2
+                height, width = image_bgr.shape[:2]
+                resized = self.predictor.aug.get_transform(image_bgr).apply_image(image_bgr)
+                tensor = torch.as_tensor(resized.astype("float32").transpose(2, 0, 1))
+                record_bytes(tensor.numpy())
+                inputs.append({"image": tensor, "height": height, "width": width})
+
+        with stage("inference"), torch.no_grad():
+            batch_instances = self.predictor.model.inference(inputs, do_postprocess=False)
+
+        results = []
+        with stage("mask_fusion"):
+            for image, instances in zip(images, batch_instances):
+                try:
+                    results.append(self._unpack(instances, image.size))
+                except Exception as e:
+                    results.append(e)
+        return results
+
+    def predict_mask(self, image):
+        return self._infer(image)[0]
+
+    def predict(self, image):
+        instances = self._infer(image)
+        with stage("render"):
+            return self._render(image, *instances)
+
+    def predict_batch(self, images):
+        """
+        Predict several images in one forward pass.
+        Returns one (overlay, mask) tuple per image in input order, or the
+        exception raised for that image.
+        """
+        results = []
+        batch_results = self._infer_batch(images)
+        with stage("render"):
+            for image, result in zip(images, batch_results):
+                if isinstance(result, Exception):
+                    results.append(result)
+                    continue
+                try:
+                    results.append(self._render(image, *result))
+                except Exception as e:
+                    results.append(e)
+        return results
 
+    def _render(self, image, semantic_mask, classes, boxes):
         # Overlay mask
-        overlay = Image.blend(image.convert("RGB"), Image.fromarray(color_mask), alpha=0.5)
+        overlay = blend_overlay(image, semantic_mask, alpha=0.5)
+        record_bytes(overlay)
         draw = ImageDraw.Draw(overlay)
         font = ImageFont.load_default()
 
-        for i in range(len(masks)):
+        for i in range(len(classes)):
             cls_id = classes[i]
             label = self.class_names.get(cls_id, str(cls_id))
             color = self.class_colors.get(cls_id, (255, 255, 255))
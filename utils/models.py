@@ -1,28 +1,208 @@
 #models.py
 
+import gc
+import importlib
+import logging
 import os
-from utils.yolov11 import YOLOPredictor
-from utils.unet import UnetPredictor
-from utils.maskrcnn import MaskRCNNPredictor
+import threading
+import time
+from PIL import Image
+import config
+from utils.backends import BACKENDS, artifact_path
 
-def load_models():
-    models = {}
-    try:
-        models["YOLOv11"] = YOLOPredictor(os.path.join("models", "yolov11_best.pt"))
-        print("YOLOv11 model loaded successfully.")
-    except Exception as e:
-        print("YOLOv11 load error:", e)
+logger = logging.getLogger(__name__)
+
+# name -> (module, class, weights file in config.MODEL_DIR)
+MODEL_SPECS = {
+    "YOLOv11": ("utils.yolov11", "YOLOPredictor", "yolov11_best.pt"),
+    "UNet": ("utils.unet", "UnetPredictor", "unet_best_model.h5"),
+    "MaskRCNN": ("utils.maskrcnn", "MaskRCNNPredictor", "maskrcnn_model_final.pth"),
+}
+
+# Fixed model input size (each predictor's input_size), None where the model takes any size.
+# Part of result cache keys, so cached results can be found without loading the model.
+MODEL_INPUT_SIZES = {
+    "YOLOv11": (512, 512),
+    "UNet": (256, 256),
+    "MaskRCNN": None,
+}
 
+
+def _rss_bytes():
+    """Resident set size of this process, or None if it cannot be read."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
     try:
-        models["UNet"] = UnetPredictor(os.path.join("models", "unet_best_model.h5"))
-        print("UNet model loaded successfully.")
-    except Exception as e:
-        print("UNet load error:", e)
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def weights_path(name):
+    return os.path.join(config.MODEL_DIR, MODEL_SPECS[name][2])
 
+
+def weights_version(name):
+    """Identify the weights on disk by backend, size and modification time."""
+    backend = config.MODEL_BACKENDS.get(name)
+    path = weights_path(name)
+    if backend is not None and name in BACKENDS:
+        path = artifact_path(path, backend)
     try:
-        models["MaskRCNN"] = MaskRCNNPredictor(os.path.join("models", "maskrcnn_model_final.pth"))
-        print("MaskRCNN model loaded successfully.")
-    except Exception as e:
-        print("MaskRCNN load error:", e)
+        stat = os.stat(path)
+    except OSError:
+        return f"{backend}-missing"
+    return f"{backend}-{stat.st_size}-{int(stat.st_mtime)}"
+
+
+def load_model(name, backend=None):
+    """
+    Import the predictor's framework and build it from its weights file on the
+    configured backend, or start its worker process in "process" execution mode.
+    """
+    if config.EXECUTION_MODE == "process":
+        from utils.workers import RemotePredictor
+        return RemotePredictor(name, backend or config.MODEL_BACKENDS.get(name))
+
+    module_name, class_name, _ = MODEL_SPECS[name]
+    predictor_cls = getattr(importlib.import_module(module_name), class_name)
+    backend = backend or config.MODEL_BACKENDS.get(name)
+    if backend is None:
+        return predictor_cls(weights_path(name))
+    return predictor_cls(weights_path(name), backend=backend)
+
+
+class ModelRegistry:
+    """
+    Loads predictors on first use instead of at import time.
+    Each model has its own lock so concurrent requests trigger a single load,
+    models can be warmed up in the background, and models idle for longer
+    than idle_timeout seconds are dropped to free memory.
+    """
+
+    def __init__(self, specs=None, idle_timeout=None):
+        self.specs = specs if specs is not None else MODEL_SPECS
+        self.idle_timeout = idle_timeout
+        self.errors = {}
+        self._models = {}
+        self._locks = {name: threading.Lock() for name in self.specs}
+        self._stats = {name: {"loads": 0, "load_seconds": None, "rss_delta_bytes": None,
+                              "last_used": None, "warm": False} for name in self.specs}
+        self._reaper = None
+        if idle_timeout:
+            self._start_reaper()
+
+    def __contains__(self, name):
+        return name in self.specs
 
+    def keys(self):
+        return self.specs.keys()
+
+    def get(self, name):
+        """Return the loaded predictor, loading it if needed, or None if unknown or failed."""
+        if name not in self.specs:
+            return None
+
+        model = self._models.get(name)
+        if model is None:
+            with self._locks[name]:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._load(name)
+
+        if model is not None:
+            self._stats[name]["last_used"] = time.time()
+        return model
+
+    def _load(self, name):
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        try:
+            model = load_model(name)
+        except Exception as e:
+            self.errors[name] = str(e)
+            logger.error("%s load error: %s", name, e)
+            return None
+
+        elapsed = time.perf_counter() - start
+        rss_after = _rss_bytes()
+        stats = self._stats[name]
+        stats["loads"] += 1
+        stats["load_seconds"] = elapsed
+        stats["rss_delta_bytes"] = rss_after - rss_before if rss_before is not None and rss_after is not None else None
+        self.errors.pop(name, None)
+        self._models[name] = model
+        logger.info("%s model loaded in %.1fs", name, elapsed)
+        return model
+
+    def warmup(self, names=None, background=True):
+        """Load the given models (default all) and run one dummy inference on each."""
+        names = list(self.specs) if names is None else list(names)
+
+        def run():
+            for name in names:
+                model = self.get(name)
+                if model is None:
+                    continue
+                size = getattr(model, "input_size", (256, 256))
+                try:
+                    model.predict(Image.new("RGB", size))
+                except Exception:
+                    pass  # empty images may yield no instances, the graph is still built
+                self._stats[name]["warm"] = True
+
+        if not background:
+            run()
+            return None
+        thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def evict(self, name):
+        """Drop a loaded model so its memory can be reclaimed; it reloads on next use."""
+        with self._locks[name]:
+            model = self._models.pop(name, None)
+            if model is not None:
+                if hasattr(model, "close"):
+                    model.close()  # stop its worker process
+                self._stats[name]["warm"] = False
+                gc.collect()
+                logger.info("%s model evicted", name)
+
+    def _start_reaper(self):
+        def reap():
+            while True:
+                time.sleep(max(self.idle_timeout / 4, 1))
+                now = time.time()
+                for name in list(self._models):
+                    last_used = self._stats[name]["last_used"] or 0
+                    if now - last_used > self.idle_timeout:
+                        self.evict(name)
+
+        self._reaper = threading.Thread(target=reap, name="model-reaper", daemon=True)
+        self._reaper.start()
+
+    def metrics(self):
+        metrics = {
+            name: dict(stats, loaded=name in self._models, error=self.errors.get(name))
+            for name, stats in self._stats.items()
+        }
+        for name, model in list(self._models.items()):
+            if hasattr(model, "health"):
+                metrics[name]["worker"] = model.health()
+        return metrics
+
+
+def load_models():
+    """Eagerly load every model into a plain dict (failed models are left out)."""
+    registry = ModelRegistry()
+    models = {}
+    for name in registry.keys():
+        model = registry.get(name)
+        if model is not None:
+            models[name] = model
     return models
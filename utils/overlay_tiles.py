@@ -0,0 +1,231 @@
+# overlay_tiles.py
+"""
+XYZ tiles of segmentation overlays for the Folium map.
+
+Masks of processed areas (map captures, regions) are cut into 256x256
+palettized PNG tiles with unlabeled pixels transparent and stored per model
+in a TileCache file. Lower zoom levels are built from the full-resolution
+mask by 2x2 majority downsampling, so browsing never re-runs a model.
+Predictions publish on a background thread, one merge per layer at a time.
+OverlayTileServer serves them at /<layer>/{z}/{x}/{y}.png with ETag and
+Cache-Control headers.
+"""
+
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from PIL import Image
+import config
+from config import CLASSES, UNLABELED
+from utils.rendering import palettized
+from utils.tile_cache import TileCache
+from utils.tile_fetcher import TILE_SIZE
+
+_stores = {}
+_stores_lock = threading.Lock()
+_publish_locks = {}
+_publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="overlay-publish")
+
+logger = logging.getLogger(__name__)
+
+
+def layer_name(model_type):
+    return model_type.lower()
+
+
+def served_layers():
+    """Layer names of the configured models (and the ensemble), the only ones the server opens."""
+    return {layer_name(model_type) for model_type in (*config.MODEL_BACKENDS, "Ensemble")}
+
+
+def get_overlay_store(layer):
+    """Shared TileCache holding the overlay tiles of one layer (never evicted)."""
+    with _stores_lock:
+        store = _stores.get(layer)
+        if store is None:
+            path = os.path.join(config.OVERLAY_TILE_DIR, f"{layer}.mbtiles")
+            # Overlay tiles are never evicted, so serving them needn't record access times
+            store = _stores[layer] = TileCache(path, track_access=False)
+            _publish_locks[layer] = threading.Lock()
+        return store
+
+
+def mode_downsample(mask):
+    """
+    Halve a class mask by taking the most frequent class of each 2x2 block.
+    Unlabeled pixels do not vote; a block is unlabeled only if all four are.
+    Ties go to the lower class id. Odd sizes are padded with UNLABELED.
+    """
+    h, w = mask.shape
+    if h % 2 or w % 2:
+        padded = np.full((h + h % 2, w + w % 2), UNLABELED, dtype=np.uint8)
+        padded[:h, :w] = mask
+        mask = padded
+    quads = (mask[0::2, 0::2], mask[0::2, 1::2], mask[1::2, 0::2], mask[1::2, 1::2])
+
+    best = np.full(quads[0].shape, UNLABELED, dtype=np.uint8)
+    best_count = np.zeros(quads[0].shape, dtype=np.uint8)
+    for class_idx in range(len(CLASSES)):
+        count = sum((quad == class_idx).view(np.uint8) for quad in quads)
+        better = count > best_count
+        best[better] = class_idx
+        best_count[better] = count[better]
+    return best
+
+
+def encode_tile(mask):
+    """Palettized PNG of a tile mask with unlabeled pixels transparent."""
+    buffer = io.BytesIO()
+    palettized(mask).save(buffer, format="PNG", transparency=UNLABELED, optimize=True)
+    return buffer.getvalue()
+
+
+def decode_tile(data):
+    with Image.open(io.BytesIO(data)) as image:
+        return np.asarray(image, dtype=np.uint8)
+
+
+def publish_mask(model_type, mask, zoom, pixel_origin, min_zoom=None):
+    """
+    Add a class mask whose top-left pixel is pixel_origin=(px, py) at zoom to
+    the model's overlay layer, for zoom down to min_zoom. Pixels of existing
+    tiles that the new mask leaves unlabeled are kept, so areas accumulate.
+    Returns the number of tiles written.
+    """
+    layer = layer_name(model_type)
+    store = get_overlay_store(layer)
+    # Tiles are read, merged and rewritten; concurrent publishes must not interleave
+    with _publish_locks[layer]:
+        return _publish_levels(store, mask, zoom, pixel_origin, min_zoom)
+
+
+def publish_mask_async(model_type, mask, zoom, pixel_origin, min_zoom=None):
+    """
+    publish_mask on the background publisher thread, off the response path;
+    mask must not be modified afterwards. Returns a Future of the tile count
+    (None if publishing failed, which is logged).
+    """
+    def run():
+        try:
+            return publish_mask(model_type, mask, zoom, pixel_origin, min_zoom)
+        except Exception:
+            logger.exception("Publishing overlay tiles failed")
+            return None
+    return _publisher.submit(run)
+
+
+def _publish_levels(store, mask, zoom, pixel_origin, min_zoom):
+    min_zoom = config.OVERLAY_MIN_ZOOM if min_zoom is None else min_zoom
+    px, py = pixel_origin
+    written = 0
+
+    for z in range(zoom, min(min_zoom, zoom) - 1, -1):
+        # Pad the mask out to whole tiles so levels and tiles stay aligned
+        x0, y0 = px // TILE_SIZE, py // TILE_SIZE
+        x1 = -(-(px + mask.shape[1]) // TILE_SIZE)
+        y1 = -(-(py + mask.shape[0]) // TILE_SIZE)
+        grid = np.full(((y1 - y0) * TILE_SIZE, (x1 - x0) * TILE_SIZE), UNLABELED, dtype=np.uint8)
+        grid[py - y0 * TILE_SIZE:py - y0 * TILE_SIZE + mask.shape[0],
+             px - x0 * TILE_SIZE:px - x0 * TILE_SIZE + mask.shape[1]] = mask
+
+        tiles = []
+        for ty in range(y0, y1):
+            for tx in range(x0, x1):
+                tile = grid[(ty - y0) * TILE_SIZE:(ty - y0 + 1) * TILE_SIZE,
+                            (tx - x0) * TILE_SIZE:(tx - x0 + 1) * TILE_SIZE]
+                unlabeled = tile == UNLABELED
+                if unlabeled.all():
+                    continue
+                if unlabeled.any():
+                    existing = store.get(z, tx, ty)
+                    if existing is not None:
+                        tile = np.where(unlabeled, decode_tile(existing), tile)
+                tiles.append((z, tx, ty, encode_tile(tile)))
+        store.put_many(tiles)
+        written += len(tiles)
+
+        # Next level down: the grid starts on a tile boundary, so its origin halves exactly when even
+        if x0 % 2:
+            grid = np.pad(grid, ((0, 0), (TILE_SIZE, 0)), constant_values=UNLABELED)
+            x0 -= 1
+        if y0 % 2:
+            grid = np.pad(grid, ((TILE_SIZE, 0), (0, 0)), constant_values=UNLABELED)
+            y0 -= 1
+        mask = mode_downsample(grid)
+        px, py = x0 * TILE_SIZE // 2, y0 * TILE_SIZE // 2
+
+    return written
+
+
+def tile_url(model_type):
+    """Leaflet URL template of a model's overlay layer."""
+    return f"{config.OVERLAY_TILE_URL}/{layer_name(model_type)}/{{z}}/{{x}}/{{y}}.png"
+
+
+class _OverlayTileHandler(BaseHTTPRequestHandler):
+    """Serves stored overlay tiles at /<layer>/{z}/{x}/{y}.png."""
+
+    def do_GET(self):
+        try:
+            layer, z, x, y = self.path.split("?")[0].strip("/").split("/")
+            z, x, y = int(z), int(x), int(y.removesuffix(".png"))
+        except ValueError:
+            self.send_error(404)
+            return
+
+        # Unknown layers must not create a store (an .mbtiles file) per requested name
+        data = get_overlay_store(layer).get(z, x, y) if layer in served_layers() else None
+        if data is None:
+            self.send_response(404)
+            self.send_header("Cache-Control", "no-cache")  # may be published later
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        etag = '"' + hashlib.blake2b(data, digest_size=8).hexdigest() + '"'
+        not_modified = self.headers.get("If-None-Match") == etag
+        self.send_response(304 if not_modified else 200)
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", f"public, max-age={config.OVERLAY_TILE_MAX_AGE}")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if not_modified:
+            self.end_headers()
+            return
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class OverlayTileServer:
+    """Background HTTP server for the overlay tile layers; start() is idempotent."""
+
+    def __init__(self, host="127.0.0.1", port=None):
+        self.host = host
+        self.port = config.OVERLAY_TILE_PORT if port is None else port
+        self.server = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.server is None:
+                self.server = ThreadingHTTPServer((self.host, self.port), _OverlayTileHandler)
+                self.port = self.server.server_port
+                threading.Thread(target=self.server.serve_forever, name="overlay-tiles", daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            if self.server is not None:
+                self.server.shutdown()
+                self.server.server_close()
+                self.server = None
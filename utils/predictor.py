@@ -1,40 +1,564 @@
 # predictor.py
 
-from utils.tile_fetcher import fetch_stitched_map
-from utils.models import load_models
-from utils.image_processing import overlay_mask_on_image, split_by_class
-from utils.area_calculator import calculate_area
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+import config
+from config import CLASSES, UNLABELED
+from utils.tile_fetcher import fetch_stitched_map, fetch_tile_grid, fetch_pixel_window, deg2pixel, deg2num, TILE_SIZE
+from utils.tiling import blend_windows, window_scores
+from utils.models import MODEL_INPUT_SIZES, ModelRegistry, weights_version
+from utils.mask_fusion import fuse_votes, pairwise_agreement
+from utils.result_cache import PredictionCache
+from utils.rendering import blend_overlay
+from utils.scheduler import BatchScheduler
+from utils.image_processing import overlay_mask_on_image
+from utils.area_calculator import calculate_area, add_ground_area, AreaAccumulator
+from utils.large_raster import open_raster, write_overlay_pyramid
+from utils.overlay_tiles import publish_mask_async
+from utils.instrumentation import profile_request, stage, set_backend, current_profile
 
-# Load all models at module level
-models = load_models()
+logger = logging.getLogger(__name__)
+
+# Pseudo model type that runs config.ENSEMBLE_MODELS in parallel and fuses their masks
+ENSEMBLE = "Ensemble"
+
+# Models are loaded on first use
+models = ModelRegistry(idle_timeout=config.MODEL_IDLE_TIMEOUT)
+if config.MODEL_WARMUP:
+    models.warmup(config.MODEL_WARMUP)
+
+result_cache = PredictionCache(config.RESULT_CACHE_SIZE, config.RESULT_CACHE_DIR) if config.RESULT_CACHE_SIZE else None
+tile_results = (
+    PredictionCache(config.MAP_TILE_CACHE_SIZE, config.MAP_TILE_CACHE_DIR)
+    if config.MAP_TILE_REUSE and config.MAP_TILE_CACHE_SIZE else None
+)
+
+def _cache_key(model_type, image):
+    # Needs no loaded model, so hits skip loading it (or starting its worker)
+    if result_cache is None:
+        return None
+    return result_cache.make_key(image, model_type, weights_version(model_type), MODEL_INPUT_SIZES.get(model_type))
+
+def _get_model(model_type):
+    with stage("load_model"):
+        model = models.get(model_type)
+    if model is not None:
+        set_backend(getattr(model, "backend", type(model).__name__))
+    return model
+
+def _attach_profile(result, profile):
+    if profile is not None:
+        result["profile"] = profile.to_dict()
+    return result
+
+def _cached_result(key, image):
+    with stage("cache_lookup"):
+        mask = result_cache.get(key) if key is not None else None
+    if mask is None:
+        return None
+    # Overlay is re-derived from the cached mask without the model's box/label annotations
+    result = _build_result(image, blend_overlay(image, mask, alpha=0.5), mask)
+    result["cached"] = True
+    return result
 
 def predict_image(image, model_type):
-    model = models.get(model_type)
-    if model is None:
+    with profile_request(f"predict_image:{model_type}") as profile:
+        if model_type == ENSEMBLE:
+            return _attach_profile(_predict_ensemble([image], None)[0], profile)
+        return _attach_profile(_predict_image(image, model_type), profile)
+
+def _predict_image(image, model_type):
+    if model_type not in models:
         return {"error": f"{model_type} model not found"}
 
     try:
-        overlay, mask = model.predict(image)
+        key = _cache_key(model_type, image)
+        result = _cached_result(key, image)
+        if result is not None:
+            return result
+
+        model = _get_model(model_type)
+        if model is None:
+            return {"error": models.errors.get(model_type, f"{model_type} model not found")}
+        with stage("model"):
+            overlay, mask = model.predict(image)
+        if key is not None:
+            result_cache.put(key, mask)
+        return _build_result(image, overlay, mask)
+
+    except Exception as e:
+        logger.exception("Prediction failed for %s", model_type)
+        return _error_result(e)
+
+def _error_result(e):
+    # Predictors raise ValueError when they find no instances (see tiling.window_scores)
+    result = {"error": str(e)}
+    if isinstance(e, ValueError):
+        result["no_instances"] = True
+    return result
+
+def _build_result(image, overlay, mask):
+    with stage("calculate_area"):
         areas = calculate_area(mask)
-        split_images = split_by_class(mask)
 
+    return {
+        "original": image,
+        "overlay": overlay,
+        "mask": mask,
+        "areas": areas
+    }
+
+def predict_images(images, model_type, batch_size=None):
+    """
+    Predict a list of images with batched forward passes of batch_size images.
+    Returns one result dict (same keys as predict_image) per image in input order;
+    images that fail get {"error": ...} without affecting the rest of the batch.
+    Cached images are answered from the result cache and skip the model.
+    """
+    with profile_request(f"predict_images:{model_type}") as profile:
+        if model_type == ENSEMBLE:
+            results = _predict_ensemble(images, batch_size)
+        else:
+            results = _predict_images(images, model_type, batch_size)
+        if profile is not None:
+            shared = profile.to_dict()
+            for result in results:
+                result["profile"] = shared
+        return results
+
+def _predict_images(images, model_type, batch_size):
+    if model_type not in models:
+        return [{"error": f"{model_type} model not found"} for _ in images]
+
+    results = [None] * len(images)
+    keys = [None] * len(images)
+    pending = []
+    for i, image in enumerate(images):
+        try:
+            keys[i] = _cache_key(model_type, image)
+            results[i] = _cached_result(keys[i], image)
+        except Exception as e:
+            results[i] = {"error": str(e)}
+        if results[i] is None:
+            pending.append(i)
+    if not pending:
+        return results
+
+    model = _get_model(model_type)
+    if model is None:
+        error = models.errors.get(model_type, f"{model_type} model not found")
+        for i in pending:
+            results[i] = {"error": error}
+        return results
+
+    batch_size = batch_size or config.PREDICT_BATCH_SIZE
+    for start in range(0, len(pending), batch_size):
+        chunk = pending[start:start + batch_size]
+        chunk_images = [images[i] for i in chunk]
+        try:
+            with stage("model"):
+                if hasattr(model, "predict_batch"):
+                    outputs = model.predict_batch(chunk_images)
+                else:
+                    outputs = [model.predict(image) for image in chunk_images]
+        except Exception as e:
+            logger.exception("Batch prediction failed for %s", model_type)
+            outputs = [e] * len(chunk)
+
+        for i, output in zip(chunk, outputs):
+            if isinstance(output, Exception):
+                results[i] = _error_result(output)
+                continue
+            try:
+                overlay, mask = output
+                if keys[i] is not None:
+                    result_cache.put(keys[i], mask)
+                results[i] = _build_result(images[i], overlay, mask)
+            except Exception as e:
+                results[i] = {"error": str(e)}
+
+    return results
+
+_ensemble_pool = ThreadPoolExecutor(
+    max_workers=config.ENSEMBLE_PARALLEL or len(config.ENSEMBLE_MODELS),
+    thread_name_prefix="ensemble"
+)
+
+def _model_version(model_type):
+    if model_type == ENSEMBLE:
+        members = "+".join(weights_version(name) for name in config.ENSEMBLE_MODELS)
+        return f"{members}|{config.ENSEMBLE_WEIGHTS!r}"
+    return weights_version(model_type)
+
+def _predict_ensemble(images, batch_size):
+    """
+    Run the ensemble members on the same images concurrently (at most
+    config.ENSEMBLE_PARALLEL at a time, each batched through predict_images)
+    and fuse the per-image masks by weighted vote.
+    Members that fail are left out of the vote and reported in "members".
+    """
+    members = config.ENSEMBLE_MODELS
+    # Decode/convert once; every member reads the same RGB image
+    images = [image if image.mode == "RGB" else image.convert("RGB") for image in images]
+
+    futures = {
+        name: _ensemble_pool.submit(predict_images, images, name, batch_size)
+        for name in members
+    }
+    outputs = {}
+    for name, future in futures.items():
+        try:
+            outputs[name] = future.result()
+        except Exception as e:
+            logger.exception("Ensemble member %s failed", name)
+            outputs[name] = [{"error": str(e)} for _ in images]
+
+    # Member stages were recorded in pool threads
+    profile = current_profile()
+    if profile is not None:
+        for name in members:
+            inner = outputs[name][0].get("profile") if outputs[name] else None
+            if inner:
+                profile.merge(inner)
+
+    results = []
+    for i, image in enumerate(images):
+        member_results = {name: outputs[name][i] for name in members}
+        masks = {name: result["mask"] for name, result in member_results.items() if "mask" in result}
+        if not masks:
+            errors = "; ".join(f"{name}: {result['error']}" for name, result in member_results.items())
+            result = {"error": f"All ensemble members failed ({errors})"}
+            if all(member.get("no_instances") for member in member_results.values()):
+                result["no_instances"] = True
+            results.append(result)
+            continue
+
+        try:
+            with stage("ensemble_fusion"):
+                for name, mask in masks.items():
+                    if mask.shape != (image.height, image.width):
+                        masks[name] = np.array(Image.fromarray(mask).resize(image.size, Image.NEAREST))
+                weights = config.ENSEMBLE_WEIGHTS or {}
+                fused = fuse_votes(list(masks.values()), [weights.get(name, 1.0) for name in masks])
+                agreement = pairwise_agreement(masks)
+
+            result = _build_result(image, blend_overlay(image, fused, alpha=0.5), fused)
+            result["model_areas"] = {name: calculate_area(mask) for name, mask in masks.items()}
+            result["model_overlays"] = {name: member_results[name]["overlay"] for name in masks}
+            result["agreement"] = agreement
+            result["members"] = {
+                name: "ok" if "mask" in member_result else member_result["error"]
+                for name, member_result in member_results.items()
+            }
+            results.append(result)
+        except Exception as e:
+            logger.exception("Ensemble fusion failed")
+            results.append({"error": str(e)})
+    return results
+
+scheduler = BatchScheduler(
+    predict_images,
+    max_batch_size=config.SCHEDULER_MAX_BATCH,
+    max_wait=config.SCHEDULER_MAX_WAIT,
+    max_queue=config.SCHEDULER_MAX_QUEUE
+)
+
+def predict_map(model_type, location_tuple, zoom, predict=predict_image, predict_many=predict_images, on_original=None):
+    """
+    Capture the 3x3 tile neighbourhood around a point and segment it.
+    on_original(image), if given, is called with the stitched capture as soon
+    as its tiles have arrived, before any inference.
+    With config.MAP_TILE_REUSE each tile's mask is predicted once, from a window
+    with MAP_TILE_HALO pixels of surrounding context, and cached per
+    (model, z, x, y): later captures only run predict_many(images, model_type)
+    on tiles not seen before. Otherwise, and always for the ensemble (whose
+    per-member masks, areas and agreement need the whole mosaic), the mosaic
+    goes through predict(image, model_type).
+    """
+    with profile_request(f"predict_map:{model_type}") as profile:
+        try:
+            lat, lon = location_tuple
+            if tile_results is not None and model_type != ENSEMBLE:
+                result = _predict_map_tiles(model_type, lat, lon, zoom, predict_many, profile, on_original)
+            else:
+                with stage("tile_fetch"):
+                    image = fetch_stitched_map(lat, lon, zoom, num_tiles=3)
+                if on_original is not None:
+                    on_original(image)
+                result = predict(image, model_type)
+                _merge_inner_profile(profile, result)
+
+            if "mask" in result:
+                center_xtile, center_ytile = deg2num(lat, lon, zoom)
+                origin = ((center_xtile - 1) * TILE_SIZE, (center_ytile - 1) * TILE_SIZE)
+                with stage("calculate_area_m2"):
+                    if "areas" in result:
+                        add_ground_area(result["areas"], result["mask"], zoom, origin[1])
+                    else:
+                        result["areas"] = calculate_area(result["mask"], zoom, origin[1])
+                result["bounds"] = {"zoom": zoom, "pixel_origin": origin, "size": result["mask"].shape[::-1]}
+                if result.get("tiles", {}).get("predicted", 1):  # reused tiles are already published
+                    _publish_overlay(model_type, result["mask"], zoom, origin)
+            return _attach_profile(result, profile)
+        except Exception as e:
+            logger.exception("Map prediction failed")
+            return _attach_profile({"error": str(e)}, profile)
+
+def _publish_overlay(model_type, mask, zoom, origin):
+    # Re-encoding the pyramid takes a while, so it happens off the response path
+    if config.OVERLAY_TILES_ENABLED:
+        publish_mask_async(model_type, mask, zoom, origin)
+
+def _merge_inner_profile(profile, result):
+    # Stages recorded in another thread (e.g. the scheduler) come back as a separate profile
+    inner = result.get("profile")
+    if profile is not None and inner and inner.get("request") != profile.name:
+        profile.merge(inner)
+
+def _predict_map_tiles(model_type, lat, lon, zoom, predict_many, profile, on_original):
+    center_xtile, center_ytile = deg2num(lat, lon, zoom)
+    x0, y0 = center_xtile - 1, center_ytile - 1
+    halo = config.MAP_TILE_HALO
+    version = _model_version(model_type)
+
+    failed = set()  # (x, y) of tiles that came back blank
+    with stage("tile_fetch"):
+        image = fetch_tile_grid(x0, y0, 3, 3, zoom, failed=failed)
+    if on_original is not None:
+        on_original(image)
+
+    mask = np.empty((3 * TILE_SIZE, 3 * TILE_SIZE), dtype=np.uint8)
+    missing = []
+    with stage("tile_mask_lookup"):
+        for row in range(3):
+            for col in range(3):
+                key = tile_results.make_tile_key(model_type, version, zoom, x0 + col, y0 + row, halo)
+                tile_mask = tile_results.get(key)
+                if tile_mask is None:
+                    missing.append((row, col, key))
+                else:
+                    mask[row * TILE_SIZE:(row + 1) * TILE_SIZE, col * TILE_SIZE:(col + 1) * TILE_SIZE] = tile_mask
+
+    if missing:
+        top = min(row for row, _, _ in missing)
+        left = min(col for _, col, _ in missing)
+        bottom = max(row for row, _, _ in missing)
+        right = max(col for _, col, _ in missing)
+        with stage("tile_fetch"):
+            context = fetch_pixel_window(
+                (x0 + left) * TILE_SIZE - halo,
+                (y0 + top) * TILE_SIZE - halo,
+                (right - left + 1) * TILE_SIZE + 2 * halo,
+                (bottom - top + 1) * TILE_SIZE + 2 * halo,
+                zoom,
+                failed=failed
+            )
+
+        size = TILE_SIZE + 2 * halo
+        windows = []
+        for row, col, _ in missing:
+            wx, wy = (col - left) * TILE_SIZE, (row - top) * TILE_SIZE
+            windows.append(context.crop((wx, wy, wx + size, wy + size)))
+
+        # Tiles whose window touches a failed fetch are predicted from blank pixels: show but never cache them
+        reach = -(-halo // TILE_SIZE)
+        incomplete = {
+            (row, col) for row, col, _ in missing
+            if any(
+                (x0 + col + dx, y0 + row + dy) in failed
+                for dy in range(-reach, reach + 1)
+                for dx in range(-reach, reach + 1)
+            )
+        }
+
+        results = predict_many(windows, model_type)
+        _merge_inner_profile(profile, results[0])
+        for (row, col, key), result in zip(missing, results):
+            if result.get("no_instances"):
+                # Nothing detected (e.g. all water or field) is a valid, unlabeled tile
+                window_mask = np.full((size, size), UNLABELED, dtype=np.uint8)
+            elif "error" in result:
+                return {"error": result["error"]}
+            else:
+                window_mask = result["mask"]
+            if window_mask.shape != (size, size):
+                window_mask = np.array(Image.fromarray(window_mask).resize((size, size), Image.NEAREST))
+            tile_mask = np.ascontiguousarray(window_mask[halo:halo + TILE_SIZE, halo:halo + TILE_SIZE])
+            if (row, col) not in incomplete:
+                tile_results.put(key, tile_mask)
+            mask[row * TILE_SIZE:(row + 1) * TILE_SIZE, col * TILE_SIZE:(col + 1) * TILE_SIZE] = tile_mask
+
+    # Overlay is re-derived from the tile masks without the model's box/label annotations
+    with stage("overlay"):
+        overlay = blend_overlay(image, mask, alpha=0.5)
+
+    return {
+        "original": image,
+        "overlay": overlay,
+        "mask": mask,
+        "tiles": {"reused": 9 - len(missing), "predicted": len(missing), "failed_fetches": len(failed)}
+    }
+
+def predict_region(model_type, bbox, zoom, window=None, overlap=None):
+    """
+    Segment the (min_lat, min_lon, max_lat, max_lon) bounding box at the given zoom.
+    Tiles are streamed through the model in overlapping native-resolution windows
+    and blended at the seams into a full-resolution class mask of any size.
+    """
+    with profile_request(f"predict_region:{model_type}") as profile:
+        return _attach_profile(_predict_region(model_type, bbox, zoom, window, overlap), profile)
+
+def _predict_region(model_type, bbox, zoom, window, overlap):
+    model = _get_model(model_type)
+    if model is None:
+        return {"error": models.errors.get(model_type, f"{model_type} model not found")}
+
+    try:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        left, top = deg2pixel(max_lat, min_lon, zoom)
+        right, bottom = deg2pixel(min_lat, max_lon, zoom)
+        px, py = int(left), int(top)
+        width, height = max(int(right) - px, 1), max(int(bottom) - py, 1)
+
+        if window is None:
+            window = getattr(model, "input_size", (config.REGION_WINDOW,))[0]
+        if overlap is None:
+            overlap = min(config.REGION_OVERLAP, window // 4)
+
+        scale = min(config.REGION_PREVIEW_SIZE / max(width, height), 1.0)
+        preview_size = (max(int(width * scale), 1), max(int(height * scale), 1))
+        preview = Image.new("RGB", preview_size)
+        band = {}
+        failed = set()  # (x, y) of tiles that came back blank in any band
+
+        def read_window(y, x, h, w):
+            # Fetch one band of tiles per row of windows and crop windows from it
+            if band.get("y") != y:
+                band["y"] = y
+                # The fetch deadline covers a 3x3 capture; scale it to the band's tile count
+                cols = (px + width - 1) // TILE_SIZE - px // TILE_SIZE + 1
+                rows = (py + y + h - 1) // TILE_SIZE - (py + y) // TILE_SIZE + 1
+                deadline = config.TILE_FETCH_DEADLINE * max(cols * rows / 9, 1)
+                band["failed"] = set()
+                with stage("tile_fetch"):
+                    band["image"] = fetch_pixel_window(
+                        px, py + y, width, h, zoom, failed=band["failed"], deadline=deadline
+                    )
+                failed.update(band["failed"])
+                preview.paste(
+                    band["image"].resize((preview_size[0], max(int(h * scale), 1))),
+                    (0, int(y * scale))
+                )
+            band["blank"] = any(
+                (tx, ty) in band["failed"]
+                for ty in range((py + y) // TILE_SIZE, (py + y + h - 1) // TILE_SIZE + 1)
+                for tx in range((px + x) // TILE_SIZE, (px + x + w - 1) // TILE_SIZE + 1)
+            )
+            return band["image"].crop((x, 0, x + w, h))
+
+        def score_window(image):
+            # Windows touching a blank tile cast no votes, so its pixels stay UNLABELED
+            if band["blank"]:
+                return np.zeros((len(CLASSES), image.height, image.width), dtype=np.float32)
+            with stage("window_inference"):
+                return window_scores(model, image, len(CLASSES))
+
+        mask = np.zeros((height, width), dtype=np.uint8)
+        areas = AreaAccumulator(zoom, py)
+        blend_windows(
+            mask,
+            read_window,
+            score_window,
+            len(CLASSES),
+            window,
+            overlap,
+            on_rows=lambda y, rows: areas.add(rows, y)
+        )
+
+        if failed:
+            logger.warning("%d tiles of the region could not be fetched and were left unlabeled", len(failed))
+        _publish_overlay(model_type, mask, zoom, (px, py))
+
+        with stage("preview"):
+            preview_mask = np.array(Image.fromarray(mask).resize(preview_size, Image.NEAREST))
+            overlay = overlay_mask_on_image(preview, preview_mask)
         return {
-            "original": image,
+            "original": preview,
             "overlay": overlay,
             "mask": mask,
-            "split_images": split_images,
-            "areas": areas
+            "areas": areas.result(),
+            "bounds": {"zoom": zoom, "pixel_origin": (px, py), "size": (width, height)},
+            "tiles": {"failed_fetches": len(failed)}
         }
-
     except Exception as e:
-        print(f"Prediction failed for {model_type}: {e}")
+        logger.exception("Region prediction failed")
         return {"error": str(e)}
 
-def predict_map(model_type, location_tuple, zoom):
+def predict_raster(model_type, path, output_dir, window=None, overlap=None):
+    """
+    Segment a local raster of any size without loading it whole. Windows are
+    read from the memory-mapped or tiled input, the class mask is blended into
+    <output_dir>/mask.npy (a memory-mapped array) and the overlay is written
+    as a Deep Zoom pyramid; memory use is bounded by one row of windows.
+    """
+    with profile_request(f"predict_raster:{model_type}") as profile:
+        return _attach_profile(_predict_raster(model_type, path, output_dir, window, overlap), profile)
+
+def _predict_raster(model_type, path, output_dir, window, overlap):
+    model = _get_model(model_type)
+    if model is None:
+        return {"error": models.errors.get(model_type, f"{model_type} model not found")}
+
     try:
-        lat, lon = location_tuple
-        image = fetch_stitched_map(lat, lon, zoom, num_tiles=3)
-        return predict_image(image, model_type)
+        if window is None:
+            window = getattr(model, "input_size", (config.REGION_WINDOW,))[0]
+        if overlap is None:
+            overlap = min(config.REGION_OVERLAP, window // 4)
+
+        os.makedirs(output_dir, exist_ok=True)
+        with open_raster(path) as reader:
+            mask_path = os.path.join(output_dir, "mask.npy")
+            mask = np.lib.format.open_memmap(mask_path, mode="w+", dtype=np.uint8, shape=(reader.height, reader.width))
+            band = {}
+
+            def read_window(y, x, h, w):
+                if band.get("y") != y:
+                    band["y"] = y
+                    with stage("raster_read"):
+                        band["pixels"] = reader.read(y, 0, h, reader.width)
+                return Image.fromarray(band["pixels"][:, x:x + w])
+
+            def score_window(image):
+                with stage("window_inference"):
+                    return window_scores(model, image, len(CLASSES))
+
+            areas = AreaAccumulator()
+            blend_windows(
+                mask,
+                read_window,
+                score_window,
+                len(CLASSES),
+                window,
+                overlap,
+                on_rows=lambda y, rows: areas.add(rows, y)
+            )
+            band.clear()
+            mask.flush()
+
+            with stage("overlay_pyramid"):
+                overlay_path = write_overlay_pyramid(reader, mask, output_dir)
+            size = reader.size
+        del mask
+
+        return {
+            "mask_path": mask_path,
+            "overlay_path": overlay_path,
+            "size": size,
+            "areas": areas.result()
+        }
     except Exception as e:
-        print(f"Map prediction failed: {e}")
+        logger.exception("Raster prediction failed")
         return {"error": str(e)}
@@ -0,0 +1,53 @@
+# rendering.py
+
+import numpy as np
+from PIL import Image
+from config import CLASSES, CLASS_COLORS, UNLABELED, UNLABELED_COLOR
+
+# 256-entry lookup table indexed by class id; other ids without a class render black
+PALETTE = np.zeros((256, 3), dtype=np.uint8)
+for _idx, _cls in enumerate(CLASSES):
+    PALETTE[_idx] = CLASS_COLORS[_cls]
+PALETTE[UNLABELED] = UNLABELED_COLOR  # Road is black
+
+_blend_luts = {}
+
+
+def colorize(mask):
+    """(H, W, 3) color image of a class mask with a single palette lookup."""
+    return PALETTE[mask]
+
+
+def palettized(mask):
+    """Class mask as a "P"-mode image sharing the class palette (one byte per pixel)."""
+    image = Image.fromarray(np.ascontiguousarray(mask, dtype=np.uint8), mode="P")
+    image.putpalette(PALETTE.ravel().tolist())
+    return image
+
+
+def _get_blend_luts(alpha):
+    luts = _blend_luts.get(alpha)
+    if luts is None:
+        # floor the image term and round the color term so the sum never exceeds 255
+        base = np.floor(np.arange(256) * (1 - alpha)).astype(np.uint8)
+        colors = np.round(PALETTE.astype(np.float32) * alpha).astype(np.uint8)
+        luts = _blend_luts[alpha] = (base, colors)
+    return luts
+
+
+def blend_overlay(image, mask, alpha=0.5):
+    """
+    Alpha-blend the class colors of mask onto image and return a new RGB image.
+    Unlabeled pixels keep the original image.
+    """
+    rgb = image if image.mode == "RGB" else image.convert("RGB")
+    out = np.array(rgb)
+    unlabeled = mask == UNLABELED
+    original = out[unlabeled] if unlabeled.any() else None
+
+    base, colors = _get_blend_luts(alpha)
+    np.take(base, out, out=out)
+    out += colors[mask]
+    if original is not None:
+        out[unlabeled] = original
+    return Image.fromarray(out)
@@ -0,0 +1,113 @@
+# result_cache.py
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def image_digest(image):
+    """Fast content hash of a PIL image's pixels, mode and size."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.mode}{image.size}".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+class PredictionCache:
+    """
+    Class masks keyed by image content, model type, weights version and
+    preprocessing parameters. Keeps the most recent max_entries masks in
+    memory and, when directory is set, also stores them as compressed .npz
+    files so they survive restarts. Masks are stored as read-only copies and
+    handed out read-only, so no caller can change a cached mask in place.
+    """
+
+    def __init__(self, max_entries=64, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(image, model_type, weights_version, params=None):
+        h = hashlib.blake2b(digest_size=20)
+        h.update(image_digest(image).encode())
+        h.update(f"|{model_type}|{weights_version}|{params!r}".encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def make_tile_key(model_type, weights_version, z, x, y, params=None):
+        """Key for the mask of map tile (z, x, y), independent of the imagery bytes."""
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{z}/{x}/{y}|{model_type}|{weights_version}|{params!r}".encode())
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.npz")
+
+    def get(self, key):
+        with self._lock:
+            mask = self._entries.get(key)
+            if mask is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return mask
+
+        if self.directory:
+            try:
+                with np.load(self._path(key)) as data:
+                    mask = data["mask"]
+            except (OSError, KeyError, ValueError):
+                mask = None
+            if mask is not None:
+                with self._lock:
+                    self.hits += 1
+                self._remember(key, mask)
+                return mask
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, mask):
+        # A copy also drops any larger array mask is a view of (e.g. a tile cut from its window)
+        mask = np.array(mask, copy=True)
+        self._remember(key, mask)
+        if self.directory:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(f, mask=mask)
+            os.replace(tmp_path, path)
+
+    def _remember(self, key, mask):
+        mask.setflags(write=False)
+        with self._lock:
+            self._entries[key] = mask
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,110 @@
+# scheduler.py
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class QueueFull(RuntimeError):
+    """Raised when a model's request queue is at its depth limit."""
+
+
+class _Request:
+    __slots__ = ("image", "future", "enqueued_at")
+
+    def __init__(self, image):
+        self.image = image
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchScheduler:
+    """
+    Per-model request queues in front of the predictors.
+    A worker thread per model takes the first waiting request, keeps
+    collecting requests for up to max_wait seconds or until max_batch_size,
+    and answers them with a single run_batch(images, model_type) call.
+    Requests beyond max_queue waiting per model are rejected with QueueFull.
+    """
+
+    def __init__(self, run_batch, max_batch_size=4, max_wait=0.02, max_queue=32):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _get_queue(self, model_type):
+        with self._lock:
+            q = self._queues.get(model_type)
+            if q is None:
+                q = self._queues[model_type] = queue.Queue(maxsize=self.max_queue)
+                self._stats[model_type] = {"requests": 0, "batches": 0, "rejected": 0}
+                threading.Thread(
+                    target=self._worker, args=(model_type, q),
+                    name=f"scheduler-{model_type}", daemon=True
+                ).start()
+            return q
+
+    def submit(self, image, model_type):
+        """Queue one image and return a Future resolving to its result dict."""
+        q = self._get_queue(model_type)
+        request = _Request(image)
+        try:
+            q.put_nowait(request)
+        except queue.Full:
+            with self._lock:
+                self._stats[model_type]["rejected"] += 1
+            raise QueueFull(f"{model_type} queue is full ({self.max_queue} waiting requests)")
+        return request.future
+
+    def predict_image(self, image, model_type, timeout=None):
+        """Blocking drop-in for utils.predictor.predict_image routed through the queue."""
+        return self.submit(image, model_type).result(timeout)
+
+    def _collect(self, q):
+        batch = [q.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(q.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self, model_type, q):
+        while True:
+            batch = self._collect(q)
+            started = time.perf_counter()
+            try:
+                results = self.run_batch([request.image for request in batch], model_type)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            with self._lock:
+                stats = self._stats[model_type]
+                stats["requests"] += len(batch)
+                stats["batches"] += 1
+            for request, result in zip(batch, results):
+                result.setdefault("timings", {}).update({
+                    "queue_wait": started - request.enqueued_at,
+                    "inference": finished - started,
+                    "batch_size": len(batch)
+                })
+                request.future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                model_type: dict(stats, queue_depth=self._queues[model_type].qsize())
+                for model_type, stats in self._stats.items()
+            }
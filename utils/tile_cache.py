@@ -0,0 +1,152 @@
+# tile_cache.py
+
+import os
+import sqlite3
+import threading
+import time
+
+
+class TileNotCached(LookupError):
+    """Raised in offline mode when a requested tile is not in the cache."""
+
+
+class TileCache:
+    """
+    Persistent (z, x, y) -> encoded tile bytes store backed by a single
+    SQLite file (MBTiles-style layout, XYZ row order).
+    Least recently used tiles are evicted once the total size exceeds max_bytes,
+    and tiles older than ttl seconds are treated as misses.
+    With track_access=False reads never write (no last_access update), for
+    stores that are not size-capped.
+    """
+
+    def __init__(self, path, max_bytes=None, ttl=None, track_access=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.track_access = track_access
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER,
+                tile_column INTEGER,
+                tile_row INTEGER,
+                tile_data BLOB,
+                size INTEGER,
+                fetched_at REAL,
+                last_access REAL,
+                PRIMARY KEY (zoom_level, tile_column, tile_row)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tiles_lru ON tiles (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM tiles").fetchone()[0]
+
+    def get(self, z, x, y):
+        """Return the cached tile bytes or None on a miss (expired tiles are dropped)."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tile_data, size, fetched_at FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                (z, x, y)
+            ).fetchone()
+
+            if row is not None and self.ttl is not None and now - row[2] > self.ttl:
+                self._delete(z, x, y, row[1])
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            if self.track_access:
+                self._conn.execute(
+                    "UPDATE tiles SET last_access=? WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                    (now, z, x, y)
+                )
+                self._conn.commit()
+            self.hits += 1
+            return bytes(row[0])
+
+    def put(self, z, x, y, data):
+        """Store tile bytes, evicting least recently used tiles if over the size cap."""
+        self.put_many([(z, x, y, data)])
+
+    def put_many(self, tiles):
+        """Store (z, x, y, data) tuples in one transaction."""
+        now = time.time()
+        with self._lock:
+            for z, x, y, data in tiles:
+                old = self._conn.execute(
+                    "SELECT size FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                    (z, x, y)
+                ).fetchone()
+                if old is not None:
+                    self._total_bytes -= old[0]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (z, x, y, sqlite3.Binary(data), len(data), now, now)
+                )
+                self._total_bytes += len(data)
+            self._evict()
+            self._conn.commit()
+
+    def _delete(self, z, x, y, size):
+        self._conn.execute(
+            "DELETE FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+            (z, x, y)
+        )
+        self._total_bytes -= size
+        self._conn.commit()
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT zoom_level, tile_column, tile_row, size FROM tiles ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for z, x, y, size in rows:
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._conn.execute(
+                    "DELETE FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                    (z, x, y)
+                )
+                self._total_bytes -= size
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "tiles": count,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM tiles")
+            self._conn.commit()
+            self._total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
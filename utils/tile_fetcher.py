@@ -1,9 +1,71 @@
 # tile_fetcher.py
 
+import logging
 import math
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
 from PIL import Image
 from io import BytesIO
+import config
+from utils.tile_cache import TileCache, TileNotCached
+
+TILE_SIZE = 256  # Standard Web Mercator tile size
+
+logger = logging.getLogger(__name__)
+
+_tile_cache = None
+_tile_cache_ready = False
+_session = None
+_executor = None
+_init_lock = threading.Lock()
+
+def get_tile_cache():
+    """Return the shared on-disk tile cache, creating it from config on first use."""
+    global _tile_cache, _tile_cache_ready
+    with _init_lock:
+        if not _tile_cache_ready:
+            if config.TILE_CACHE_PATH:
+                _tile_cache = TileCache(
+                    config.TILE_CACHE_PATH,
+                    max_bytes=config.TILE_CACHE_MAX_BYTES,
+                    ttl=config.TILE_CACHE_TTL
+                )
+            _tile_cache_ready = True
+    return _tile_cache
+
+def set_tile_cache(cache):
+    """Replace the shared tile cache (None disables caching)."""
+    global _tile_cache, _tile_cache_ready
+    with _init_lock:
+        _tile_cache = cache
+        _tile_cache_ready = True
+
+def get_session():
+    """Return the shared keep-alive HTTP session used for tile downloads."""
+    global _session
+    with _init_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=config.TILE_FETCH_WORKERS
+            )
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers.update({"User-Agent": "Mozilla/5.0"})
+    return _session
+
+def _get_executor():
+    global _executor
+    with _init_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=config.TILE_FETCH_WORKERS,
+                thread_name_prefix="tile-fetch"
+            )
+    return _executor
 
 def deg2num(lat_deg, lon_deg, zoom):
     """Convert latitude and longitude to tile x, y coordinates."""
@@ -13,39 +75,116 @@ def deg2num(lat_deg, lon_deg, zoom):
     ytile = int((1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n)
     return xtile, ytile
 
-def fetch_tile_from_coords(xtile, ytile, zoom):
-    """Fetch a single tile from Esri by tile x, y coordinates."""
-    url = f"https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{zoom}/{ytile}/{xtile}"
-    headers = {
-        "User-Agent": "Mozilla/5.0"
-    }
+def deg2pixel(lat_deg, lon_deg, zoom):
+    """Convert latitude and longitude to global Web Mercator pixel x, y at the given zoom."""
+    lat_rad = math.radians(lat_deg)
+    n = 2.0 ** zoom * TILE_SIZE
+    x = (lon_deg + 180.0) / 360.0 * n
+    y = (1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n
+    return x, y
 
-    response = requests.get(url, headers=headers, timeout=10)
-    response.raise_for_status()
-    return Image.open(BytesIO(response.content)).convert("RGB")
+def fetch_tile_bytes(xtile, ytile, zoom, deadline=None):
+    """
+    Return the encoded tile, from the cache when possible, otherwise from the tile server.
+    Failed downloads are retried with exponential backoff until deadline (a time.monotonic() value).
+    """
+    cache = get_tile_cache()
+    if cache is not None:
+        data = cache.get(zoom, xtile, ytile)
+        if data is not None:
+            return data
 
-def fetch_stitched_map(lat, lon, zoom, num_tiles=3):
+    if config.TILE_OFFLINE:
+        raise TileNotCached(f"Tile ({zoom}, {xtile}, {ytile}) not cached and offline mode is on")
+
+    url = config.TILE_URL.format(z=zoom, x=xtile, y=ytile)
+    session = get_session()
+
+    for attempt in range(config.TILE_FETCH_RETRIES + 1):
+        timeout = config.TILE_REQUEST_TIMEOUT
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                raise TimeoutError(f"Deadline exceeded for tile ({zoom}, {xtile}, {ytile})")
+
+        try:
+            response = session.get(url, timeout=timeout)
+            response.raise_for_status()
+            break
+        except requests.RequestException as e:
+            status = getattr(e.response, "status_code", None)
+            retryable = status is None or status == 429 or status >= 500
+            if not retryable or attempt == config.TILE_FETCH_RETRIES:
+                raise
+            delay = config.TILE_FETCH_BACKOFF * (2 ** attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise
+            time.sleep(delay)
+
+    if cache is not None:
+        cache.put(zoom, xtile, ytile, response.content)
+    return response.content
+
+def fetch_tile_from_coords(xtile, ytile, zoom, deadline=None):
+    """Fetch a single tile from Esri by tile x, y coordinates."""
+    return Image.open(BytesIO(fetch_tile_bytes(xtile, ytile, zoom, deadline))).convert("RGB")
+
+def fetch_tile_grid(x0, y0, cols, rows, zoom, deadline=None, failed=None):
     """
-    Fetch a stitched Esri satellite image centered at (lat, lon).
-    Returns a PIL.Image stitched from num_tiles x num_tiles grid.
+    Fetch the cols x rows block of tiles whose top-left tile is (x0, y0) concurrently
+    and paste each tile as soon as it arrives. Tiles that fail or miss the overall
+    deadline (seconds, defaults to config.TILE_FETCH_DEADLINE) are left black and,
+    when failed is a set, their (x, y) tile coordinates are added to it.
     """
-    center_xtile, center_ytile = deg2num(lat, lon, zoom)
-    half = num_tiles // 2
-    tile_size = 256  # Standard Web Mercator tile size
-    stitched_image = Image.new("RGB", (tile_size * num_tiles, tile_size * num_tiles))
+    if deadline is None:
+        deadline = config.TILE_FETCH_DEADLINE
+    deadline_at = time.monotonic() + deadline
+    stitched_image = Image.new("RGB", (TILE_SIZE * cols, TILE_SIZE * rows))
 
-    for dx in range(-half, half + 1):
-        for dy in range(-half, half + 1):
-            xtile = center_xtile + dx
-            ytile = center_ytile + dy
+    executor = _get_executor()
+    futures = {}
+    for row in range(rows):
+        for col in range(cols):
+            future = executor.submit(fetch_tile_from_coords, x0 + col, y0 + row, zoom, deadline_at)
+            futures[future] = (col, row)
 
+    try:
+        for future in as_completed(futures, timeout=max(deadline_at - time.monotonic(), 0)):
+            col, row = futures[future]
             try:
-                tile = fetch_tile_from_coords(xtile, ytile, zoom)
-                stitched_image.paste(
-                    tile,
-                    ((dx + half) * tile_size, (dy + half) * tile_size)
-                )
+                stitched_image.paste(future.result(), (col * TILE_SIZE, row * TILE_SIZE))
             except Exception as e:
-                print(f"Skipping tile ({xtile}, {ytile}) due to error: {e}")
+                logger.warning("Skipping tile (%d, %d) due to error: %s", x0 + col, y0 + row, e)
+                if failed is not None:
+                    failed.add((x0 + col, y0 + row))
+    except FutureTimeout:
+        pending = [f for f in futures if not f.done()]
+        for future in pending:
+            future.cancel()
+            if failed is not None:
+                col, row = futures[future]
+                failed.add((x0 + col, y0 + row))
+        logger.warning("Tile deadline of %ss exceeded, %d tiles left blank", deadline, len(pending))
 
     return stitched_image
+
+def fetch_pixel_window(px, py, width, height, zoom, failed=None, deadline=None):
+    """
+    Fetch the width x height block of global pixels whose top-left corner is
+    (px, py) at the given zoom, stitched from the tiles that cover it.
+    Tiles that could not be fetched are added to failed as in fetch_tile_grid.
+    """
+    x0, y0 = px // TILE_SIZE, py // TILE_SIZE
+    x1, y1 = (px + width - 1) // TILE_SIZE, (py + height - 1) // TILE_SIZE
+    grid = fetch_tile_grid(x0, y0, x1 - x0 + 1, y1 - y0 + 1, zoom, deadline=deadline, failed=failed)
+    left, top = px - x0 * TILE_SIZE, py - y0 * TILE_SIZE
+    return grid.crop((left, top, left + width, top + height))
+
+def fetch_stitched_map(lat, lon, zoom, num_tiles=3):
+    """
+    Fetch a stitched Esri satellite image centered at (lat, lon).
+    Returns a PIL.Image stitched from num_tiles x num_tiles grid.
+    """
+    center_xtile, center_ytile = deg2num(lat, lon, zoom)
+    half = num_tiles // 2
+    return fetch_tile_grid(center_xtile - half, center_ytile - half, num_tiles, num_tiles, zoom)
@@ -0,0 +1,129 @@
+# tiling.py
+
+import numpy as np
+from PIL import Image
+from config import UNLABELED
+
+
+def window_origins(length, window, stride):
+    """Start offsets of windows of size window covering [0, length) with the given stride."""
+    if length <= window:
+        return [0]
+    origins = list(range(0, length - window, stride))
+    origins.append(length - window)
+    return origins
+
+
+def blend_weights(window, overlap):
+    """
+    2D weight map for a window: 1 in the interior, ramping linearly down over
+    the overlap at each edge so neighbouring windows cross-fade at the seams.
+    """
+    ramp = np.ones(window, dtype=np.float32)
+    if overlap > 0:
+        edge = (np.arange(overlap, dtype=np.float32) + 1) / (overlap + 1)
+        ramp[:overlap] = edge
+        ramp[window - overlap:] = edge[::-1]
+    return np.outer(ramp, ramp)
+
+
+def window_scores(predictor, image, num_classes):
+    """
+    Per-class scores (C, h, w) for one window. Uses the predictor's class
+    probabilities when it has them, otherwise a one-hot of its semantic mask.
+    Windows where an instance model finds nothing contribute no votes.
+    """
+    if hasattr(predictor, "predict_proba"):
+        return predictor.predict_proba(image)
+
+    scores = np.zeros((num_classes, image.size[1], image.size[0]), dtype=np.float32)
+    try:
+        mask = predictor.predict_mask(image)
+    except ValueError:
+        return scores
+    for class_idx in range(num_classes):
+        scores[class_idx] = mask == class_idx  # unlabeled pixels vote for nothing
+    return scores
+
+
+def resize_scores(scores, size):
+    """Bilinearly resize (C, h, w) scores to size=(w, h)."""
+    if (scores.shape[2], scores.shape[1]) == tuple(size):
+        return scores
+    return np.stack([
+        np.asarray(Image.fromarray(channel.astype(np.float32), mode="F").resize(size, Image.BILINEAR))
+        for channel in scores
+    ])
+
+
+class SeamBlender:
+    """
+    Assembles a class mask from overlapping window scores one row of windows
+    at a time. Only a band of window height x region width is accumulated, and
+    rows are argmaxed into out as soon as no later window can touch them (the
+    argmax needs no normalisation by the summed weights);
+    on_rows(y, rows) is then called with each finished block of rows.
+    """
+
+    def __init__(self, out, num_classes, window, overlap, on_rows=None):
+        self.out = out
+        self.on_rows = on_rows
+        self.height, self.width = out.shape
+        self.num_classes = num_classes
+        self.window = window
+        self.overlap = overlap
+        self.weights = blend_weights(window, overlap)
+
+        band = min(window, self.height)
+        self._scores = np.zeros((num_classes, band, self.width), dtype=np.float32)
+        self._top = 0
+
+    def add(self, y, x, scores):
+        """Accumulate (C, h, w) scores for the window whose top-left corner is (y, x)."""
+        h, w = scores.shape[1:]
+        weights = self.weights[:h, :w] if (h, w) != self.weights.shape else self.weights
+        row = y - self._top
+        self._scores[:, row:row + h, x:x + w] += scores * weights
+
+    def advance(self, next_y):
+        """Finalize rows above next_y (the top of the next window row) and shift the band."""
+        done = next_y - self._top
+        if done <= 0:
+            return
+        scores = self._scores[:, :done]
+        labels = np.argmax(scores, axis=0).astype(np.uint8)
+        labels[scores.max(axis=0) <= 0] = UNLABELED  # no window voted for any class
+        self.out[self._top:next_y] = labels
+        if self.on_rows is not None:
+            self.on_rows(self._top, self.out[self._top:next_y])
+
+        self._scores[:, :-done] = self._scores[:, done:].copy()
+        self._scores[:, -done:] = 0
+        self._top = next_y
+
+    def finish(self):
+        self.advance(self.height)
+        return self.out
+
+
+def blend_windows(out, read_window, score_window, num_classes, window, overlap, on_rows=None):
+    """
+    Run score_window(image) over overlapping windows of the region and blend
+    the results into out, a (H, W) uint8 array (may be a np.memmap).
+    read_window(y0, x0, h, w) returns the PIL image of one window.
+    """
+    height, width = out.shape
+    stride = max(window - overlap, 1)
+    blender = SeamBlender(out, num_classes, window, overlap, on_rows)
+    rows = window_origins(height, window, stride)
+    cols = window_origins(width, window, stride)
+
+    for i, y in enumerate(rows):
+        h = min(window, height - y)
+        for x in cols:
+            w = min(window, width - x)
+            blender.add(y, x, score_window(read_window(y, x, h, w)))
+        if i + 1 < len(rows):
+            blender.advance(rows[i + 1])
+
+    return blender.finish()
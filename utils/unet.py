@@ -2,14 +2,25 @@
 
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
+from utils.rendering import blend_overlay
+from utils.instrumentation import stage, record_bytes
 import tensorflow as tf
-from scipy.ndimage import label, center_of_mass
+import config
+from utils.tiling import resize_scores
+from utils.annotations import label_regions
+from utils.backends import TFLiteModel, artifact_path, check_backend, configure_tf_threads
 
 class UnetPredictor:
-    def __init__(self, model_path, num_classes=6):
-        self.model = tf.keras.models.load_model(model_path, compile=False)
+    def __init__(self, model_path, num_classes=6, backend="keras"):
+        check_backend("UNet", backend)
+        configure_tf_threads()
+        if backend == "keras":
+            self.model = tf.keras.models.load_model(model_path, compile=False)
+        else:
+            self.model = TFLiteModel(artifact_path(model_path, backend), num_threads=config.CPU_INTRA_OP_THREADS)
         self.num_classes = num_classes
         self.input_size = (256, 256)  # This must match training
+        self.backend = f"tensorflow-{backend}"
 
         self.class_names = {
             0: "Buildings",
@@ -34,37 +45,70 @@ class UnetPredictor:
         image = np.array(image) / 255.0
         return np.expand_dims(image, axis=0)
 
-    def predict(self, image):
-        original_size = image.size
-        input_array = self.preprocess(image)
+    def predict_proba(self, image):
+        """Class probabilities (C, H, W) resized to the image size."""
+        pred = self.model.predict(self.preprocess(image))[0]
+        return resize_scores(np.transpose(pred, (2, 0, 1)), image.size)
 
-        pred = self.model.predict(input_array)[0]
+    def _to_mask(self, pred, size):
+        """Low-resolution argmax mask and the same mask resized to size."""
         pred_mask = np.argmax(pred, axis=-1).astype(np.uint8)
 
         # Resize to original size
-        semantic_mask_img = Image.fromarray(pred_mask).resize(original_size, Image.NEAREST)
-        semantic_mask = np.array(semantic_mask_img)
+        semantic_mask_img = Image.fromarray(pred_mask).resize(size, Image.NEAREST)
+        return pred_mask, np.array(semantic_mask_img)
 
-        # Create overlay
-        color_mask = np.zeros((semantic_mask.shape[0], semantic_mask.shape[1], 3), dtype=np.uint8)
-        for class_idx, color in self.class_colors.items():
-            color_mask[semantic_mask == class_idx] = color
+    def _predict_masks(self, image):
+        with stage("preprocess"):
+            input_array = self.preprocess(image)
+            record_bytes(input_array)
+        with stage("inference"):
+            pred = self.model.predict(input_array)[0]
+        with stage("mask_assembly"):
+            pred_mask, semantic_mask = self._to_mask(pred, image.size)
+            record_bytes(pred, semantic_mask)
+        return pred_mask, semantic_mask
 
-        overlay = Image.blend(image.convert("RGB"), Image.fromarray(color_mask), alpha=0.5)
-        draw = ImageDraw.Draw(overlay)
-        font = ImageFont.load_default()
+    def predict_mask(self, image):
+        return self._predict_masks(image)[1]
 
-        # Draw labels at centers of class regions
-        for class_idx, class_name in self.class_names.items():
-            binary_mask = (semantic_mask == class_idx).astype(np.uint8)
-            if binary_mask.sum() == 0:
-                continue
+    def predict(self, image):
+        pred_mask, semantic_mask = self._predict_masks(image)
+        with stage("render"):
+            return self._render(image, semantic_mask, pred_mask)
 
-            labeled_mask, num_features = label(binary_mask)
-            centers = center_of_mass(binary_mask, labeled_mask, range(1, num_features + 1))
+    def predict_batch(self, images):
+        """
+        Predict several images in one forward pass.
+        Returns one (overlay, mask) tuple per image in input order.
+        """
+        with stage("preprocess"):
+            batch = np.concatenate([self.preprocess(image) for image in images], axis=0)
+            record_bytes(batch)
+        with stage("inference"):
+            preds = self.model.predict(batch, batch_size=len(images))
+        with stage("mask_assembly_and_render"):
+            outputs = []
+            for image, pred in zip(images, preds):
+                pred_mask, semantic_mask = self._to_mask(pred, image.size)
+                outputs.append(self._render(image, semantic_mask, pred_mask))
+            return outputs
+
+    def _render(self, image, semantic_mask, pred_mask):
+        # Create overlay
+        overlay = blend_overlay(image, semantic_mask, alpha=0.5)
+        record_bytes(overlay)
+        draw = ImageDraw.Draw(overlay)
+        font = ImageFont.load_default()
 
-            for center in centers:
-                y, x = map(int, center)
-                draw.text((x, y), class_name, fill=self.class_colors[class_idx], font=font)
+        # Draw labels at the centers of the larger class regions, found on the low-res prediction
+        regions = label_regions(
+            pred_mask,
+            min_area=config.ANNOTATION_MIN_AREA,
+            max_per_class=config.ANNOTATION_MAX_PER_CLASS,
+            output_size=image.size
+        )
+        for class_idx, x, y, _ in regions:
+            draw.text((x, y), self.class_names[class_idx], fill=self.class_colors[class_idx], font=font)
 
         return overlay, semantic_mask
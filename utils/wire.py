@@ -0,0 +1,112 @@
+# wire.py
+"""
+Compact encodings of results sent to the browser.
+
+Display images are downscaled to config.DISPLAY_MAX_SIZE and written once as
+JPEG/WebP files, so the UI ships small files instead of re-encoding
+full-size PNGs. The full-resolution class mask is offered as a separate
+download: a palettized PNG (colorized by the viewer), a compressed .npz, or
+a run-length encoded JSON.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import numpy as np
+from PIL import Image
+import config
+from utils.rendering import palettized
+
+DISPLAY_DIR = os.path.join(tempfile.gettempdir(), "satseg-results")
+_FORMAT_SUFFIXES = {"jpeg": ".jpg", "webp": ".webp", "png": ".png"}
+_last_prune = [0.0]
+_prune_lock = threading.Lock()
+
+
+def _new_path(suffix):
+    os.makedirs(DISPLAY_DIR, exist_ok=True)
+    _prune()
+    return os.path.join(DISPLAY_DIR, f"{uuid.uuid4().hex}{suffix}")
+
+
+def _prune():
+    """Delete result files older than config.DISPLAY_FILE_TTL (at most once a minute)."""
+    now = time.time()
+    with _prune_lock:
+        if now - _last_prune[0] < 60:
+            return
+        _last_prune[0] = now
+    with os.scandir(DISPLAY_DIR) as entries:
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime > config.DISPLAY_FILE_TTL:
+                    os.remove(entry.path)
+            except OSError:
+                pass  # removed concurrently
+
+
+def fit_size(size, max_size):
+    """(w, h) scaled down to fit max_size on the longer side (unchanged if it already fits)."""
+    width, height = size
+    if max_size is None or max(width, height) <= max_size:
+        return size
+    scale = max_size / max(width, height)
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def display_file(image, max_size=None, fmt=None, quality=None):
+    """Write image downscaled for display in the configured lossy format; returns the file path."""
+    max_size = config.DISPLAY_MAX_SIZE if max_size is None else max_size
+    fmt = fmt or config.DISPLAY_FORMAT
+    quality = quality or config.DISPLAY_QUALITY
+
+    size = fit_size(image.size, max_size)
+    if size != image.size:
+        image = image.resize(size, Image.BILINEAR)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    path = _new_path(_FORMAT_SUFFIXES[fmt])
+    image.save(path, format=fmt.upper(), quality=quality)
+    return path
+
+
+def class_image_file(image):
+    """Write a palettized per-class view as PNG (three colors compress far better than JPEG)."""
+    path = _new_path(".png")
+    image.save(path, format="PNG", compress_level=1)
+    return path
+
+
+def rle_encode(mask):
+    """Row-major run-length encoding of a class mask: {"shape", "values", "lengths"}."""
+    flat = np.ascontiguousarray(mask, dtype=np.uint8).ravel()
+    if flat.size == 0:
+        return {"shape": list(mask.shape), "values": [], "lengths": []}
+    starts = np.flatnonzero(np.diff(flat)) + 1
+    starts = np.concatenate(([0], starts))
+    lengths = np.diff(np.concatenate((starts, [flat.size])))
+    return {"shape": list(mask.shape), "values": flat[starts].tolist(), "lengths": lengths.tolist()}
+
+
+def rle_decode(rle):
+    values = np.asarray(rle["values"], dtype=np.uint8)
+    return np.repeat(values, rle["lengths"]).reshape(rle["shape"])
+
+
+def mask_file(mask, fmt=None):
+    """Write the full-resolution class mask for download; returns the file path."""
+    fmt = fmt or config.MASK_DOWNLOAD_FORMAT
+    if fmt == "npz":
+        path = _new_path(".npz")
+        np.savez_compressed(path, mask=mask)
+    elif fmt == "rle":
+        path = _new_path(".json")
+        with open(path, "w") as f:
+            json.dump(rle_encode(mask), f, separators=(",", ":"))
+    else:
+        path = _new_path(".png")
+        palettized(mask).save(path, format="PNG", compress_level=6)
+    return path
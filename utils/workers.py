@@ -0,0 +1,429 @@
+# workers.py
+"""
+Process-isolated model execution (config.EXECUTION_MODE = "process").
+
+Each model runs in its own spawned worker process with a fixed thread budget
+and, optionally, pinned CPU cores, so framework thread pools and memory
+growth cannot interfere with each other or crash the UI process. Images,
+masks, overlays and class scores travel through two shared-memory buffers
+per worker; the pipe only carries small control messages. A monitor thread
+pings the workers and restarts any that died.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+from multiprocessing import shared_memory
+import numpy as np
+from PIL import Image
+import config
+from config import CLASSES
+
+THREAD_ENV = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+              "TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS"]
+_ALIGN = 8
+_RAISABLE = {"ValueError": ValueError}
+
+logger = logging.getLogger(__name__)
+
+_live = weakref.WeakSet()
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+class WorkerCrashed(RuntimeError):
+    """Raised when a model worker process dies or stops answering mid-request."""
+
+
+def _attach(name):
+    """Attach to a segment created by the parent, which stays responsible for unlinking it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: spawned children share the parent's resource tracker,
+        # so the duplicate registration is harmless and must not be undone here
+        return shared_memory.SharedMemory(name=name)
+
+
+class _SharedBuffer:
+    """A parent-owned shared-memory segment that is replaced by a larger one when needed."""
+
+    def __init__(self):
+        self.shm = None
+
+    def ensure(self, size):
+        if self.shm is None or self.shm.size < size:
+            self.release()
+            self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1 << 20))
+        return self.shm
+
+    def release(self):
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+
+def _layout(shapes, dtypes):
+    """Aligned byte offsets for consecutive arrays and the total size."""
+    offsets, total = [], 0
+    for shape, dtype in zip(shapes, dtypes):
+        total = -(-total // _ALIGN) * _ALIGN
+        offsets.append(total)
+        total += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return offsets, total
+
+
+def _view(shm, offset, shape, dtype):
+    return np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+
+
+def _output_spec(op, height, width):
+    if op == "predict_proba":
+        return [((len(CLASSES), height, width), np.float32)]
+    if op == "predict_mask":
+        return [((height, width), np.uint8)]
+    return [((height, width), np.uint8), ((height, width, 3), np.uint8)]  # mask, overlay
+
+
+# --- worker process -------------------------------------------------------
+
+def _pin(threads, cores):
+    for name in THREAD_ENV:
+        os.environ[name] = str(threads)
+    config.CPU_INTRA_OP_THREADS = threads
+    config.CPU_INTER_OP_THREADS = 1
+    if cores and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError as e:
+            logger.warning("Could not pin worker to cores %s: %s", cores, e)
+
+
+def _write_outputs(shm, offsets, specs, image, outputs):
+    # Normalize to the input size so the parent's preallocated layout always fits
+    for offset, (shape, dtype), value in zip(offsets, specs, outputs):
+        if dtype == np.float32:
+            from utils.tiling import resize_scores
+            value = resize_scores(value, image.size)
+        elif isinstance(value, Image.Image):
+            value = value.convert("RGB")
+            if value.size != image.size:
+                value = value.resize(image.size)
+            value = np.asarray(value)
+        elif value.shape != shape:
+            value = np.array(Image.fromarray(value).resize(image.size, Image.NEAREST))
+        _view(shm, offset, shape, dtype)[...] = value
+
+
+def _worker_main(name, backend, threads, cores, conn):
+    _pin(threads, cores)
+    config.EXECUTION_MODE = "thread"
+    from utils.models import load_model
+
+    try:
+        model = load_model(name, backend)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", {
+        "input_size": getattr(model, "input_size", None),
+        "backend": getattr(model, "backend", None),
+        "predict_proba": hasattr(model, "predict_proba")
+    }))
+
+    attached = {}
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        op = message[0]
+        if op == "close":
+            break
+        if op == "ping":
+            from utils.models import _rss_bytes
+            conn.send(("pong", _rss_bytes()))
+            continue
+
+        _, in_name, in_offsets, sizes, out_name, out_offsets = message
+        try:
+            # The parent replaces a buffer when it outgrows it; drop segments it no longer uses
+            for stale in set(attached) - {in_name, out_name}:
+                attached.pop(stale).close()
+            for shm_name in (in_name, out_name):
+                if shm_name not in attached:
+                    attached[shm_name] = _attach(shm_name)
+            inputs, outputs = attached[in_name], attached[out_name]
+            images = [
+                Image.fromarray(_view(inputs, offset, (h, w, 3), np.uint8))
+                for offset, (w, h) in zip(in_offsets, sizes)
+            ]
+
+            if op == "predict_batch" and hasattr(model, "predict_batch"):
+                results = model.predict_batch(images)
+            else:
+                results = []
+                for image in images:
+                    try:
+                        results.append(getattr(model, op if op != "predict_batch" else "predict")(image))
+                    except Exception as e:
+                        if op != "predict_batch":
+                            raise
+                        results.append(e)
+
+            errors = []
+            for image, result, offsets in zip(images, results, out_offsets):
+                if isinstance(result, Exception):
+                    errors.append((type(result).__name__, str(result)))
+                    continue
+                specs = _output_spec(op, image.height, image.width)
+                if op in ("predict", "predict_batch"):
+                    overlay, mask = result
+                    result = (mask, overlay)
+                else:
+                    result = (result,)
+                _write_outputs(outputs, offsets, specs, image, result)
+                errors.append(None)
+            conn.send(("ok", errors))
+        except Exception as e:
+            conn.send(("raise", type(e).__name__, str(e)))
+
+    for shm in attached.values():
+        shm.close()
+
+
+# --- parent side ----------------------------------------------------------
+
+def _budget(name):
+    """(threads, cores) for a model's worker from config, splitting the machine evenly by default."""
+    names = list(config.MODEL_BACKENDS)
+    if hasattr(os, "sched_getaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+    else:
+        available = list(range(os.cpu_count() or 1))
+    threads = (config.WORKER_THREADS or {}).get(name) or max(len(available) // len(names), 1)
+    cores = (config.WORKER_CORES or {}).get(name)
+    if cores is None and config.WORKER_PIN_CORES and name in names:
+        start = names.index(name) * threads
+        cores = [available[(start + i) % len(available)] for i in range(threads)]
+    return threads, cores
+
+
+class RemotePredictor:
+    """
+    Stand-in for a predictor that forwards predict / predict_mask /
+    predict_batch (and predict_proba when the model has it) to a worker
+    process. The worker is started on construction, restarted on demand
+    after a crash, and stopped by close().
+    """
+
+    def __init__(self, name, backend=None):
+        self.name = name
+        self.backend_name = backend
+        self.threads, self.cores = _budget(name)
+        self.restarts = 0
+        self.last_error = None
+        self.last_ping = None
+        self._lock = threading.Lock()
+        self._process = None
+        self._conn = None
+        self._inputs = _SharedBuffer()
+        self._outputs = _SharedBuffer()
+        with self._lock:
+            self._start()
+        if self._info["predict_proba"]:
+            self.predict_proba = self._predict_proba
+        _live.add(self)
+        _ensure_monitor()
+
+    @property
+    def input_size(self):
+        return self._info["input_size"]
+
+    @property
+    def backend(self):
+        return self._info["backend"] or self.backend_name
+
+    def _start(self):
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=_worker_main,
+            args=(self.name, self.backend_name, self.threads, self.cores, child_conn),
+            name=f"model-worker-{self.name}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+
+        if not parent_conn.poll(config.WORKER_START_TIMEOUT):
+            process.kill()
+            raise WorkerCrashed(f"{self.name} worker did not start within {config.WORKER_START_TIMEOUT}s")
+        try:
+            status, info = parent_conn.recv()
+        except EOFError:
+            process.join()
+            raise WorkerCrashed(f"{self.name} worker exited during startup (code {process.exitcode})")
+        if status == "error":
+            process.join()
+            raise RuntimeError(info)
+
+        self._process, self._conn, self._info = process, parent_conn, info
+        logger.info("%s worker started (pid %d, %s threads, cores %s)", self.name, process.pid, self.threads, self.cores)
+
+    def _kill(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.join()
+        if self._conn is not None:
+            self._conn.close()
+        self._process = self._conn = None
+
+    def restart(self, reason):
+        """Replace the worker process (called with the lock held)."""
+        self.last_error = reason
+        self._kill()
+        self.restarts += 1
+        logger.warning("%s worker restarting: %s", self.name, reason)
+        self._start()
+
+    def alive(self):
+        return self._process is not None and self._process.is_alive()
+
+    def _recv(self, timeout):
+        if not self._conn.poll(timeout):
+            raise WorkerCrashed(f"{self.name} worker did not answer within {timeout}s")
+        return self._conn.recv()
+
+    def _call(self, op, images):
+        images = [image if image.mode == "RGB" else image.convert("RGB") for image in images]
+        in_shapes = [(image.height, image.width, 3) for image in images]
+        in_offsets, in_size = _layout(in_shapes, [np.uint8] * len(images))
+
+        specs = [_output_spec(op, image.height, image.width) for image in images]
+        flat = [spec for per_image in specs for spec in per_image]
+        flat_offsets, out_size = _layout([shape for shape, _ in flat], [dtype for _, dtype in flat])
+        out_offsets, i = [], 0
+        for per_image in specs:
+            out_offsets.append(flat_offsets[i:i + len(per_image)])
+            i += len(per_image)
+
+        with self._lock:
+            if not self.alive():
+                self.restart(f"worker not running (last error: {self.last_error})")
+            inputs = self._inputs.ensure(in_size)
+            outputs = self._outputs.ensure(out_size)
+            for image, offset, shape in zip(images, in_offsets, in_shapes):
+                _view(inputs, offset, shape, np.uint8)[...] = np.asarray(image)
+
+            try:
+                self._conn.send((op, inputs.name, in_offsets, [image.size for image in images],
+                                 outputs.name, out_offsets))
+                reply = self._recv(config.WORKER_REQUEST_TIMEOUT)
+            except (WorkerCrashed, EOFError, OSError) as e:
+                # Leave the dead or hung process for the next call / the monitor to replace
+                self.last_error = str(e) or type(e).__name__
+                self._kill()
+                raise WorkerCrashed(f"{self.name} worker failed: {self.last_error}") from e
+
+            if reply[0] == "raise":
+                raise _RAISABLE.get(reply[1], RuntimeError)(reply[2])
+
+            results = []
+            for error, offsets, per_image in zip(reply[1], out_offsets, specs):
+                if error is not None:
+                    results.append(_RAISABLE.get(error[0], RuntimeError)(error[1]))
+                    continue
+                results.append(tuple(
+                    _view(outputs, offset, shape, dtype).copy()
+                    for offset, (shape, dtype) in zip(offsets, per_image)
+                ))
+            return results
+
+    def predict_mask(self, image):
+        return self._call("predict_mask", [image])[0][0]
+
+    def _predict_proba(self, image):
+        return self._call("predict_proba", [image])[0][0]
+
+    def predict(self, image):
+        mask, overlay = self._call("predict", [image])[0]
+        return Image.fromarray(overlay), mask
+
+    def predict_batch(self, images):
+        return [
+            result if isinstance(result, Exception) else (Image.fromarray(result[1]), result[0])
+            for result in self._call("predict_batch", images)
+        ]
+
+    def check(self):
+        """Ping an idle worker; restart it if it is dead or does not answer."""
+        if not self._lock.acquire(blocking=False):
+            return  # busy with a request, which detects crashes itself
+        try:
+            if self._conn is not None and self.alive():
+                try:
+                    self._conn.send(("ping",))
+                    _, rss = self._recv(config.WORKER_HEALTH_TIMEOUT)
+                    self.last_ping = {"at": time.time(), "rss_bytes": rss}
+                    return
+                except (WorkerCrashed, EOFError, OSError) as e:
+                    reason = f"health check failed: {e or type(e).__name__}"
+            else:
+                reason = f"worker not running (last error: {self.last_error})"
+            try:
+                self.restart(reason)
+            except Exception as e:
+                self.last_error = f"restart failed: {e}"
+        finally:
+            self._lock.release()
+
+    def health(self):
+        return {
+            "pid": self._process.pid if self._process is not None else None,
+            "alive": self.alive(),
+            "threads": self.threads,
+            "cores": self.cores,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+            "last_ping": self.last_ping
+        }
+
+    def close(self):
+        _live.discard(self)
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self._conn.send(("close",))
+                except OSError:
+                    pass
+            if self._process is not None:
+                self._process.join(timeout=5)
+            self._kill()
+            self._inputs.release()
+            self._outputs.release()
+
+
+def _ensure_monitor():
+    global _monitor
+    with _monitor_lock:
+        if _monitor is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(config.WORKER_HEALTH_INTERVAL)
+                for worker in list(_live):
+                    worker.check()
+
+        _monitor = threading.Thread(target=run, name="model-worker-monitor", daemon=True)
+        _monitor.start()
+
+
+def worker_health():
+    return {worker.name: worker.health() for worker in list(_live)}
@@ -3,11 +3,17 @@
 import torch
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
+from utils.rendering import blend_overlay
+from utils.mask_fusion import fuse_dense
+from utils.backends import artifact_path, check_backend, configure_torch_threads
+from utils.instrumentation import stage, record_bytes
 from ultralytics import YOLO
 
 class YOLOPredictor:
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path, backend="pytorch"):
+        check_backend("YOLOv11", backend)
+        configure_torch_threads()
+        self.model = YOLO(artifact_path(model_path, backend), task="segment")
         self.class_names = {
             0: "Buildings",
             1: "Hills",
@@ -24,40 +30,51 @@ class YOLOPredictor:
             4: (28, 106, 11),
             5: (19, 158, 244)
         }
+        self.input_size = (512, 512)
+        self.backend = f"ultralytics-{backend}"
 
-    def predict(self, image):
-        original_size = image.size
-        image_resized = image.resize((512, 512))
-        img = np.array(image_resized)
-        results = self.model(img)
-
-        if results[0].masks is None or results[0].boxes is None:
+    def _semantic_from_result(self, result, original_size):
+        """Turn one YOLO result into the semantic mask at original size with instance classes and boxes."""
+        if result.masks is None or result.boxes is None:
             raise ValueError("No segmentation masks or boxes found in YOLO output.")
 
-        masks = results[0].masks.data.cpu().numpy()  # (N, H, W)
-        classes = results[0].boxes.cls.cpu().numpy().astype(np.uint8)  # (N,)
-        boxes = results[0].boxes.xyxy.cpu().numpy()  # (N, 4)
+        masks = result.masks.data.cpu().numpy()  # (N, H, W)
+        classes = result.boxes.cls.cpu().numpy().astype(np.uint8)  # (N,)
+        boxes = result.boxes.xyxy.cpu().numpy()  # (N, 4)
+        scores = result.boxes.conf.cpu().numpy()  # (N,)
 
-        # Resize masks to original size
-        semantic_mask = np.zeros((masks.shape[1], masks.shape[2]), dtype=np.uint8)
-        for i in range(len(masks)):
-            semantic_mask[masks[i] > 0.5] = classes[i]
+        # Overlaps go to the most confident instance, then resize to original size
+        semantic_mask = fuse_dense(masks, classes, scores)
         semantic_mask = Image.fromarray(semantic_mask).resize(original_size, Image.NEAREST)
         semantic_mask_np = np.array(semantic_mask)
+        record_bytes(masks, semantic_mask_np)
+        return semantic_mask_np, classes, boxes
 
-        # Create color overlay
-        color_mask = np.zeros((semantic_mask_np.shape[0], semantic_mask_np.shape[1], 3), dtype=np.uint8)
-        for class_idx, color in self.class_colors.items():
-            color_mask[semantic_mask_np == class_idx] = color
+    def _infer(self, image):
+        """Run the model and return the semantic mask at image size with instance classes and boxes."""
+        with stage("preprocess"):
+            img = np.array(image.resize(self.input_size))
+            record_bytes(img)
+        with stage("inference"):
+            results = self.model(img)
+        with stage("mask_assembly"):
+            return self._semantic_from_result(results[0], image.size)
+
+    def predict_mask(self, image):
+        return self._infer(image)[0]
+
+    def _render(self, image, semantic_mask_np, classes, boxes):
+        original_size = image.size
 
-        # Prepare overlay and drawing
-        overlay = Image.blend(image.convert("RGB"), Image.fromarray(color_mask), alpha=0.5)
+        # Create color overlay
+        overlay = blend_overlay(image, semantic_mask_np, alpha=0.5)
+        record_bytes(overlay)
         draw = ImageDraw.Draw(overlay)
         font = ImageFont.load_default()
 
         # Scale boxes back to original image size and draw labels
-        w_ratio = original_size[0] / 512
-        h_ratio = original_size[1] / 512
+        w_ratio = original_size[0] / self.input_size[0]
+        h_ratio = original_size[1] / self.input_size[1]
         for i in range(len(boxes)):
             cls_id = classes[i]
             label = self.class_names.get(cls_id, str(cls_id))
@@ -68,3 +85,29 @@ class YOLOPredictor:
             draw.text((x1, y1 - 10), label, fill=self.class_colors[cls_id], font=font)
 
         return overlay, semantic_mask_np
+
+    def predict(self, image):
+        semantic = self._infer(image)
+        with stage("render"):
+            return self._render(image, *semantic)
+
+    def predict_batch(self, images):
+        """
+        Predict several images in one forward pass.
+        Returns one (overlay, mask) tuple per image in input order, or the
+        exception raised for that image (e.g. no instances found).
+        """
+        with stage("preprocess"):
+            batch = [np.array(image.resize(self.input_size)) for image in images]
+            record_bytes(*batch)
+        with stage("inference"):
+            results = self.model(batch)
+
+        outputs = []
+        with stage("mask_assembly_and_render"):
+            for image, result in zip(images, results):
+                try:
+                    outputs.append(self._render(image, *self._semantic_from_result(result, image.size)))
+                except Exception as e:
+                    outputs.append(e)
+        return outputs